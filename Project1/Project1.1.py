@@ -1,8 +1,16 @@
 import argparse
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.stats import norm
+from scipy.stats import norm, qmc
 import sys
+import os
+import time
+from vegas import vegas
+from importance_sampling import register_integrand, register_density, inverse_cdf_density, densities, compare
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from mocp.accumulators import RunningStats  # noqa: E402
+from mocp.parallel import run_replicates  # noqa: E402
 
 rng = np.random.default_rng(42)
 
@@ -18,10 +26,69 @@ For part c) I need to:
 '''
 
 
+@register_integrand('x^4')
+def integrand(x):
+    return x ** 4
+
+
+for _power in [1, 2, 3, 4]:  # Sampling distributions g(x) = (p+1) x^p, sampled as x = u^{1/(p+1)}.
+    register_density(f'{_power+1}x^{_power}', inverse_cdf_density(lambda x, p=_power: (p + 1) * x ** p,
+                                                                  lambda u, p=_power: u ** (1. / (p + 1))))
+
+
+def mc_integrator_stream(a, b, abs_error=0., rel_error=0., time_budget=np.inf, chunk=2**16, max_samples=None):
+    '''
+    Draw chunks of 'chunk' points until the standard error of the integral is below 'abs_error' or below 'rel_error'
+    times the integral, or until 'time_budget' seconds have passed (or 'max_samples' points were used). Only the online
+    accumulators are kept, so memory does not depend on the number of points.
+    Returns the integral, its standard error and the number of points used.
+    '''
+    int_volume = b - a
+    stats = RunningStats()
+    start = time.perf_counter()
+    while True:
+        points = int_volume * rng.random(chunk) + a
+        stats.update(integrand(points))
+        mc_integral = int_volume * stats.mean
+        std_error = int_volume * stats.std_error
+        if (std_error <= abs_error or std_error <= rel_error * np.abs(mc_integral)
+                or time.perf_counter() - start >= time_budget
+                or (max_samples is not None and stats.count >= max_samples)):
+            return mc_integral, std_error, stats.count
+
+
+def unit_samples(sampler, samples, replicates=1):
+    '''
+    Array of shape (replicates, samples) with points in [0, 1) given by the chosen sampler:
+        -'random': Pseudo-random numbers (plain Monte-Carlo).
+        -'sobol', 'halton': Scrambled low-discrepancy sequences. Sobol' points keep their balance properties only
+         for a power of two of them, so 'samples' must be one.
+        -'stratified': One uniform point in each of 'samples' strata of equal width.
+        -'lhs': Latin hypercube sample.
+    Every replicate is an independent randomization, so the spread of the replicate estimates is an unbiased error
+    estimate also when the points of a set are not independent.
+    '''
+    if sampler == 'random':
+        return rng.random((replicates, samples))
+    if sampler == 'stratified':
+        return (np.arange(samples) + rng.random((replicates, samples))) / samples
+    if sampler == 'sobol' and samples & (samples - 1):
+        raise ValueError(f"The 'sobol' sampler needs a power of two of samples, not {samples}")
+    engines = {'sobol': qmc.Sobol, 'halton': qmc.Halton, 'lhs': qmc.LatinHypercube}
+    points = np.empty((replicates, samples))
+    for i in range(replicates):
+        engine = engines[sampler](d=1, scramble=True, seed=rng)
+        if sampler == 'sobol':
+            points[i] = engine.random_base2(int(samples).bit_length() - 1)[:, 0]
+        else:
+            points[i] = engine.random(samples)[:, 0]
+    return points
+
+
 def mc_integrator(sampling_distribution):
     int_volume = args.b - args.a
-    points = int_volume * rng.random(args.N) + args.a
-    function = points ** 4
+    points = int_volume * unit_samples(args.sampler, args.N)[0] + args.a
+    function = integrand(points)
     g = sampling_distribution(points)
     avg_function = np.sum(function * g) / args.N
     avg_sqr_function = np.sum(function * function * g) / args.N
@@ -30,6 +97,68 @@ def mc_integrator(sampling_distribution):
     return mc_integral, std_error
 
 
+def mc_integrator_batch(a, b, samples, replicates, max_bytes=2**27, generator=rng):
+    '''
+    Same estimate as 'mc_integrator' (with g(x) = 1) for 'replicates' independent sets of 'samples' points at once.
+    The (replicates, samples) matrix of points is never stored as a whole: it is drawn in 2D blocks of at most
+    'max_bytes' bytes and only the row-wise sums of f and f^2 are kept.
+    '''
+    int_volume = b - a
+    columns = max(1, min(samples, max_bytes // 8))  # A single set of points may not fit in memory by itself.
+    rows = max(1, min(replicates, max_bytes // (8 * columns)))
+    sum_function = np.zeros(replicates)
+    sum_sqr_function = np.zeros(replicates)
+    for row in range(0, replicates, rows):
+        block_rows = min(rows, replicates - row)
+        for column in range(0, samples, columns):
+            points = generator.random((block_rows, min(columns, samples - column)))
+            points *= int_volume
+            points += a
+            function = integrand(points)
+            sum_function[row:row + block_rows] += np.sum(function, axis=1)
+            sum_sqr_function[row:row + block_rows] += np.einsum('ij,ij->i', function, function)
+    avg_function = sum_function / samples
+    avg_sqr_function = sum_sqr_function / samples
+    mc_integrals = int_volume * avg_function
+    std_errors = int_volume * np.sqrt((avg_sqr_function - avg_function ** 2) / (samples - 1))
+    return mc_integrals, std_errors
+
+
+def integral_task(generator, a, b, samples):
+    # A single integral with its own random stream, for 'run_replicates'.
+    mc_integrals, std_errors = mc_integrator_batch(a, b, samples, 1, generator=generator)
+    return mc_integrals[0], std_errors[0]
+
+
+def randomized_integrator(sampler, samples, replicates):
+    # Integral and its error from the spread of 'replicates' independent randomizations of the point set.
+    int_volume = args.b - args.a
+    points = int_volume * unit_samples(sampler, samples, replicates) + args.a
+    mc_integrals = int_volume * np.mean(integrand(points), axis=1)
+    return np.mean(mc_integrals), np.std(mc_integrals, ddof=1) / np.sqrt(replicates), np.var(mc_integrals, ddof=1)
+
+
+def multidimensional_integral():
+    # Integral of the product x_1^4 ... x_d^4 over [a, b]^d with VEGAS and with plain Monte-Carlo, using the same
+    # total number of function evaluations for both.
+    def product_integrand(x):
+        return np.prod(integrand(x), axis=1)
+
+    lower, upper = np.full(args.dim, args.a), np.full(args.dim, args.b)
+    exact = ((args.b ** 5 - args.a ** 5) / 5.) ** args.dim
+    mc_integral, std_error, chi2_dof = vegas(product_integrand, lower, upper, args.N, iterations=args.iterations,
+                                             generator=rng)
+    print("VEGAS gives:", mc_integral, "with a standard error of", std_error, f"(chi^2/dof = {chi2_dof:.2f})")
+    evaluations = args.N * args.iterations
+    points = lower + (upper - lower) * rng.random((evaluations, args.dim))
+    function = product_integrand(points)
+    int_volume = np.prod(upper - lower)
+    print("Plain Monte-Carlo gives:", int_volume * np.mean(function), "with a standard error of",
+          int_volume * np.std(function, ddof=1) / np.sqrt(evaluations))
+    print("Exact value:", exact)
+    return
+
+
 def histogram_and_gaussian(data):
     plt.hist(data, bins=80, density=True, ec='black', lw=0.5, color='dodgerblue', label='Data generated')
 
@@ -54,46 +183,66 @@ def histogram_and_gaussian(data):
 
 
 def importance_sampling_1():
-    averages = []
-    std_dev = []
     sampling_power = [1, 2, 3, 4]
-    for power in sampling_power:
-        integral_value = []
-        std_errors = []
-        for _ in range(args.M):
-            numbers = rng.random(args.N)
-            x = np.power(numbers, 1./(power+1))
-            function = x ** 4
-            sampling_distribution = (power + 1) * x**power
-            avg_function = np.sum(np.divide(function, sampling_distribution))/args.N
-            avg_sqr_function = np.sum(np.divide(function * function, sampling_distribution))/args.N
-            std_error = np.sqrt((avg_sqr_function - avg_function ** 2) / (args.N - 1))
-            integral_value.append(avg_function)
-            std_errors.append(std_error)
-        averages.append(np.mean(integral_value))
-        std_dev.append(np.mean(std_errors))
+    pairs = [('x^4', f'{power+1}x^{power}') for power in sampling_power]
+    results = compare(pairs, args.N, replicates=args.M, generator=rng)
+    averages = [result['estimate'] for result in results]
+    std_dev = [result['std_error'] for result in results]
     return averages, std_dev
 
 
+def compare_densities():
+    names = densities if args.densities == 'all' else args.densities.split(',')
+    results = compare([(args.integrand, name) for name in names], args.N, replicates=args.M,
+                      target_error=args.target_error, generator=rng)
+    print(f'{"density":>10} {"estimate":>12} {"std. error":>12} {"var/sample":>12} {"s/sample":>12} '
+          f'{"s to target":>12}')
+    for result in sorted(results, key=lambda row: row['time_to_target']):
+        print(f'{result["density"]:>10} {result["estimate"]:12.6f} {result["std_error"]:12.3e} '
+              f'{result["variance"]:12.3e} {result["time_per_sample"]:12.3e} {result["time_to_target"]:12.3e}')
+    return
+
+
+def convergence_curves(sampling_power, n_values, replicates=10, max_bytes=2**27):
+    '''
+    Estimate and standard error of the integral for every N in 'n_values', using the sampling distributions
+    g(x) = (p+1) x^p for all p in 'sampling_power' at once. Each replicate stream of uniform numbers is drawn only once,
+    up to max(n_values), in chunks of at most 'max_bytes' bytes; the results for every N are read from the running
+    sums of f/g and (f/g)^2. The same uniform numbers are shared among the sampling powers.
+    Returns two arrays of shape (len(sampling_power), replicates, len(n_values)).
+    '''
+    n_values = np.asarray(n_values)
+    powers = np.asarray(sampling_power, dtype=float)[:, np.newaxis, np.newaxis]
+    chunk = max(1, max_bytes // (8 * np.size(powers) * replicates))
+    sum_weights = np.zeros((np.size(powers), replicates, 1))
+    sum_sqr_weights = np.zeros((np.size(powers), replicates, 1))
+    averages = np.empty((np.size(powers), replicates, np.size(n_values)))
+    averages_sqr = np.empty_like(averages)
+    done = 0
+    while done < np.max(n_values):
+        size = min(chunk, np.max(n_values) - done)
+        x = np.power(rng.random((replicates, size)), 1. / (powers + 1))
+        weights = integrand(x) / ((powers + 1) * x ** powers)
+        running_sum = np.cumsum(weights, axis=-1) + sum_weights
+        running_sqr_sum = np.cumsum(weights * weights, axis=-1) + sum_sqr_weights
+        in_chunk = (n_values > done) & (n_values <= done + size)
+        averages[..., in_chunk] = running_sum[..., n_values[in_chunk] - done - 1] / n_values[in_chunk]
+        averages_sqr[..., in_chunk] = running_sqr_sum[..., n_values[in_chunk] - done - 1] / n_values[in_chunk]
+        sum_weights = running_sum[..., -1:]
+        sum_sqr_weights = running_sqr_sum[..., -1:]
+        done += size
+    std_errors = np.sqrt(np.maximum(averages_sqr - averages ** 2, 0.) / (n_values - 1))  # f/g is constant for p = 4
+    return averages, std_errors
+
+
 def importance_sampling_2():
     sampling_power = [1, 2, 3, 4]
-    for power in sampling_power:
-        std_dev = []
-        n_values = []
-        for n in range(10, 1000, 10):
-            errors = []
-            for _ in range(10):
-                numbers = rng.random(n)
-                x = np.power(numbers, 1. / (power + 1))
-                function = x ** 4
-                sampling_distribution = (power+1) * x ** power
-                avg_function = np.sum(np.divide(function, sampling_distribution)) / n
-                avg_sqr_function = np.sum(np.divide(function * function, sampling_distribution)) / n
-                std_error = np.sqrt((avg_sqr_function - avg_function ** 2) / (n - 1))
-                errors.append(std_error)
-            std_dev.append(np.mean(errors))
-            n_values.append(n)
-        plt.loglog(n_values, std_dev, label=f'$g(x) = {power+1} x^{power}$')
+    n_values = np.unique(np.geomspace(10, args.n_max, num=100).astype(int))
+    _, std_errors = convergence_curves(sampling_power, n_values, replicates=10)
+    std_dev = np.mean(std_errors, axis=1)
+    for i in range(np.size(sampling_power)):
+        power = sampling_power[i]
+        plt.loglog(n_values, std_dev[i], label=f'$g(x) = {power+1} x^{power}$')
     plt.xlabel('$\\log{N}$')
     plt.ylabel('$\\log{\\sigma_{N}}$')
     plt.legend()
@@ -102,15 +251,40 @@ def importance_sampling_2():
 
 
 def main():
+    if args.abs_error or args.rel_error or args.time_budget:
+        mc_integral, std_error, samples = mc_integrator_stream(args.a, args.b, args.abs_error, args.rel_error,
+                                                               args.time_budget or np.inf)
+        print("The Monte-Carlo integrator gives:", mc_integral, "with a standard error of", std_error,
+              f"using {samples:,.0f} points")
+        sys.exit()
+    if args.dim > 1:
+        multidimensional_integral()
+        sys.exit()
+    if args.densities:
+        compare_densities()
+        sys.exit()
     if not args.part_c:
         def sampling_distribution(_):  # For cases (a) and (b) the sampling distribution is 1.
             return 1
+        if args.part_a and args.sampler != 'random':
+            mc_integral, std_error, variance = randomized_integrator(args.sampler, args.N, args.M)
+            _, _, random_variance = randomized_integrator('random', args.N, args.M)
+            print(f"The '{args.sampler}' sampler gives:", mc_integral, "with a standard error of", std_error)
+            # Plain Monte-Carlo needs this many times more points for the same error (its variance goes as 1/N).
+            print("Effective speedup against plain Monte-Carlo:", random_variance / variance)
+            sys.exit()
         if args.part_a:
             mc_integral, std_error = mc_integrator(sampling_distribution)
             print("The Monte-Carlo integrator gives:", mc_integral, "with a standard error of", std_error)
             sys.exit()
 
-        integral = [mc_integrator(sampling_distribution)[0] for _ in range(args.M)]
+        if args.workers:
+            integral = run_replicates(integral_task, args.M, [(args.a, args.b, args.N)] * args.M,
+                                      workers=args.workers)[:, 0]
+        elif args.batched:
+            integral, _ = mc_integrator_batch(args.a, args.b, args.N, args.M, max_bytes=int(args.memory * 2**20))
+        else:
+            integral = [mc_integrator(sampling_distribution)[0] for _ in range(args.M)]
         histogram_and_gaussian(integral)
         sys.exit()
 
@@ -127,6 +301,38 @@ if __name__ == '__main__':
     parser.add_argument('--part_a', default=False, action="store_true", help="Obtain results for part a)")
     parser.add_argument('--part_b', default=True, action="store_true", help="Obtain results for part b)")
     parser.add_argument('--part_c', default=False, action="store_true", help="Obtain results for part c)")
+    parser.add_argument('--batched', default=False, action="store_true",
+                        help="Evaluate the M integrals of part b) as 2D blocks instead of one call per integral.")
+    parser.add_argument('--sampler', type=str, default='random',
+                        choices=['random', 'sobol', 'halton', 'stratified', 'lhs'],
+                        help="Points used by the integrator. For part a) the error is estimated from M randomizations. "
+                             "With sobol, N is rounded up to a power of two")
+    parser.add_argument('--dim', type=int, default=1,
+                        help="Integrate the product of the integrand over [a, b]^dim with VEGAS (if dim > 1)")
+    parser.add_argument('--iterations', type=int, default=10,
+                        help="Iterations of N points each for VEGAS (the first 2 only adapt the grid)")
+    parser.add_argument('--abs_error', type=float, default=0.,
+                        help="Draw points until the standard error is below this value (streaming mode)")
+    parser.add_argument('--rel_error', type=float, default=0.,
+                        help="Draw points until the relative standard error is below this value (streaming mode)")
+    parser.add_argument('--time_budget', type=float, default=0.,
+                        help="Stop the streaming mode after this many seconds")
+    parser.add_argument('--memory', type=float, default=128, help="Memory budget (in MiB) for a block in --batched")
+    parser.add_argument('--n_max', type=int, default=1000, help="Largest N in the convergence curves of part c)")
+    parser.add_argument('--integrand', type=str, default='x^4', help="Registered integrand for --densities")
+    parser.add_argument('--densities', type=str, default='',
+                        help="Comma separated registered sampling densities to compare (or 'all')")
+    parser.add_argument('--target_error', type=float, default=1e-4,
+                        help="Standard error used to report the time-to-target in --densities")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Run the M integrals of part b) on this many processes, each with its own seed stream")
     parser.add_argument('--save', default=False, action="store_true", help="Save plots generated.")
     args = parser.parse_args()
+    if (args.batched or args.workers) and args.sampler != 'random':
+        parser.error('--batched and --workers only support --sampler random')
+    if args.sampler == 'sobol' and args.N & (args.N - 1):
+        args.N = 1 << (args.N - 1).bit_length()
+        print(f"Sobol' points are balanced only in powers of two: using N = {args.N}")
+    if args.dim > 1 and args.iterations <= 2:
+        parser.error('--iterations must be larger than the 2 warm-up iterations of VEGAS')
     main()
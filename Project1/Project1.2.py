@@ -1,6 +1,12 @@
 import argparse
 import numpy as np
 import matplotlib.pyplot as plt
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from mocp.parallel import run_replicates  # noqa: E402
+from mocp.snapshots import SnapshotStore  # noqa: E402
 
 rng = np.random.default_rng(42)
 
@@ -8,9 +14,9 @@ a = -1
 b = 1
 
 
-def random_walk(n):
-    values_x = (b - a) * rng.random(n) + a
-    values_y = (b - a) * rng.random(n) + a
+def random_walk(n, generator=rng):
+    values_x = (b - a) * generator.random(n) + a
+    values_y = (b - a) * generator.random(n) + a
     length = np.sqrt(values_x ** 2 + values_y ** 2)
     steps_x = values_x / length
     steps_y = values_y / length
@@ -21,6 +27,55 @@ def random_walk(n):
     return x, y
 
 
+def walk_ensemble(walkers, steps, checkpoints=(), max_bytes=2**26, generator=rng):
+    '''
+    Advance 'walkers' independent walks of 'steps' unit steps together, in blocks of (walkers, steps) random angles of
+    at most 'max_bytes' bytes, keeping only the current position of every walker (trajectories are never stored).
+    The direction of each step is drawn directly as a uniform angle in [0, 2 pi).
+    Returns the distance from the origin of every walker after the last step and, for every N in 'checkpoints', the
+    ensemble mean of R_N^2 and its standard error.
+    '''
+    checkpoints = np.sort(np.asarray(checkpoints, dtype=int))
+    if np.size(checkpoints) and (checkpoints[0] < 1 or checkpoints[-1] > steps):
+        raise ValueError(f'The checkpoints must be between 1 and the number of steps ({steps}), not {checkpoints}')
+    if np.size(checkpoints) and walkers < 2:
+        raise ValueError('The standard error of <R^2> needs at least 2 walkers')
+    rows = min(walkers, max(1, max_bytes // (8 * min(steps, 1024))))
+    columns = min(steps, max(1, max_bytes // (8 * rows)))
+    final_distances = np.empty(walkers)
+    sum_r2 = np.zeros(np.size(checkpoints))
+    sum_r4 = np.zeros(np.size(checkpoints))
+    for row in range(0, walkers, rows):
+        block_rows = min(rows, walkers - row)
+        x = np.zeros(block_rows)
+        y = np.zeros(block_rows)
+        for done in range(0, steps, columns):
+            size = min(columns, steps - done)
+            angles = 2. * np.pi * generator.random((block_rows, size))
+            in_block = (checkpoints > done) & (checkpoints <= done + size)
+            if np.any(in_block):  # Positions after every step of the block are only needed to read the checkpoints.
+                path_x = x[:, np.newaxis] + np.cumsum(np.cos(angles), axis=1)
+                path_y = y[:, np.newaxis] + np.cumsum(np.sin(angles), axis=1)
+                index = checkpoints[in_block] - done - 1
+                r2 = path_x[:, index] ** 2 + path_y[:, index] ** 2
+                sum_r2[in_block] += np.sum(r2, axis=0)
+                sum_r4[in_block] += np.sum(r2 * r2, axis=0)
+                x, y = path_x[:, -1], path_y[:, -1]
+            else:
+                x += np.sum(np.cos(angles), axis=1)
+                y += np.sum(np.sin(angles), axis=1)
+        final_distances[row:row + block_rows] = np.sqrt(x ** 2 + y ** 2)
+    mean_r2 = sum_r2 / walkers
+    r2_error = np.sqrt(np.maximum(sum_r4 / walkers - mean_r2 ** 2, 0.) / (walkers - 1))
+    return final_distances, mean_r2, r2_error
+
+
+def final_distance_task(generator, n):
+    # Distance from the origin after a single walk of n steps with its own random stream, for 'run_replicates'.
+    x, y = random_walk(n, generator)
+    return np.sqrt(x[-1]**2 + y[-1]**2)
+
+
 def get_histogram(data, n, m):
     plt.hist(data, bins=100, ec='black', lw=0.5, color='dodgerblue', label='Data generated')
     plt.title(f'Distance from the origin after {n:,.0f} steps \n for {m:,.0f} independent simulations')
@@ -30,11 +85,18 @@ def get_histogram(data, n, m):
     return
 
 
-def get_rms_distance(x, y):
-    dx = np.array([x[i+1] - x[i] for i in range(np.size(x) - 1)])
-    dy = np.array([y[i+1] - y[i] for i in range(np.size(y) - 1)])
-    rms_distance = np.sqrt(np.sum(dx**2 + dy**2))
-    return rms_distance
+def scaling_analysis(walkers, n_max, points=20, generator=rng):
+    '''
+    Ensemble <R^2>_N and its standard error for N on a log-spaced grid up to 'n_max', all from a single ensemble run,
+    and the fit <R^2>_N = D N^nu (weighted least squares of the logarithms). For a random walk nu = 1.
+    The points of the grid come from the same walks, so they are correlated and the error of nu is only indicative.
+    Returns the N values, <R^2>_N, its error, nu, the error of nu and D.
+    '''
+    n_values = np.unique(np.geomspace(10, n_max, num=points).astype(int))
+    _, mean_r2, r2_error = walk_ensemble(walkers, n_max, n_values, generator=generator)
+    (exponent, log_prefactor), covariance = np.polyfit(np.log(n_values), np.log(mean_r2), 1, w=mean_r2 / r2_error,
+                                                        cov='unscaled')
+    return n_values, mean_r2, r2_error, exponent, np.sqrt(covariance[0, 0]), np.exp(log_prefactor)
 
 
 def main():
@@ -43,6 +105,10 @@ def main():
         x1, y1 = random_walk(n)
         x2, y2 = random_walk(n)
         x3, y3 = random_walk(n)
+        if args.snapshots:  # Every run adds its walks to the series.
+            with SnapshotStore(args.snapshots) as store:
+                walks = [np.stack(walk, axis=-1) for walk in ((x1, y1), (x2, y2), (x3, y3))]
+                store.extend('random_walks-part_a', walks, kind='float32', attributes={'steps': n})
         plt.plot(x1, y1, 'b', x2, y2, 'g', x3, y3, 'r')
         plt.axhline(0, color='k')
         plt.axvline(0, color='k')
@@ -51,25 +117,27 @@ def main():
         plt.title(f'3 random walks in 2 dimensions after {n:,.0f} steps')
         plt.savefig('Proj1.2a.png', dpi=1200)
     else:
-        n = 10000  # Number of steps
-        m = 1000  # Number of independent simulations
-        last_steps = []
-        for i in range(m):
-            x, y = random_walk(n)
-            final_distance = np.sqrt(x[-1]**2 + y[-1]**2)
-            last_steps.append(final_distance)
+        n = args.steps  # Number of steps
+        m = args.walkers  # Number of independent simulations
+        if args.ensemble:
+            last_steps, _, _ = walk_ensemble(m, n)
+        elif args.workers:
+            last_steps = run_replicates(final_distance_task, m, [(n,)] * m, workers=args.workers)
+        else:
+            last_steps = []
+            for i in range(m):
+                x, y = random_walk(n)
+                final_distance = np.sqrt(x[-1]**2 + y[-1]**2)
+                last_steps.append(final_distance)
         get_histogram(last_steps, n, m)  # Save an image containing the histogram.
         # Comparison of the computed root-mean-square to the theoretical value for different number of steps
-        rms_distances = []
-        steps_list = list(range(1000, 20000, 1000))
-        for steps in steps_list:
-            x, y = random_walk(steps)
-            rms = get_rms_distance(x, y)
-            rms_distances.append(rms)
+        steps_list, mean_r2, r2_error, exponent, exponent_error, _ = scaling_analysis(m, args.n_max)
+        print(f'Fit <R^2> ~ N^nu gives nu = {exponent:.4f} +- {exponent_error:.4f}')
         plt.clf()  # Needed to clear the contains of plt.plot(), i.e., so that the histogram doesn't appear again
-        plt.plot(steps_list, rms_distances, 'bo', markersize=6, label='$ \\sqrt{\\langle R^{2} \\rangle_{N}} $')
+        plt.errorbar(steps_list, np.sqrt(mean_r2), yerr=r2_error / (2 * np.sqrt(mean_r2)), fmt='bo', markersize=6,
+                     label='$ \\sqrt{\\langle R^{2} \\rangle_{N}} $')
         steps_min, steps_max = plt.xlim()
-        steps = np.linspace(steps_min, steps_max, 100)
+        steps = np.linspace(max(steps_min, 0), steps_max, 100)
         plt.plot(steps, np.sqrt(steps), 'r', label='$ \\sqrt{N} \\cdot r_{rms} $')
         plt.xlabel('Number of steps ($ N $)')
         plt.ylabel('Root-mean-square distance')
@@ -84,5 +152,19 @@ def main():
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--part_a', default=False, action="store_true", help="Obtain results for part a)")
+    parser.add_argument('--steps', type=int, default=10000, help="Number of steps of every walk in part b)")
+    parser.add_argument('--walkers', type=int, default=1000, help="Number of independent walks in part b)")
+    parser.add_argument('--n_max', type=int, default=20000, help="Largest number of steps in the <R^2> scaling")
+    parser.add_argument('--ensemble', default=False, action="store_true",
+                        help="Advance all the walks of part b) together without storing their trajectories")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Run the independent walks on this many processes, each with its own seed stream")
+    parser.add_argument('--snapshots', type=str, default=None,
+                        help="Directory where the walks of part a) are stored as float32 trajectories, appended to "
+                             "the series 'random_walks-part_a'")
     args = parser.parse_args()
+    if not args.part_a and args.walkers < 2:
+        parser.error('--walkers must be at least 2 for the errors of <R^2> in part b)')
+    if not args.part_a and args.n_max < 10:
+        parser.error('--n_max must be at least 10, the smallest N of the <R^2> scaling')
     main()
@@ -1,6 +1,7 @@
 import argparse
 import numpy as np
 import matplotlib.pyplot as plt
+from scipy.linalg import expm
 
 rng = np.random.default_rng(42)
 
@@ -15,18 +16,116 @@ def discrete_decay(initial_nuclei, decay_rate):
     return nuclei_time
 
 
+def binomial_decay(initial_nuclei, decay_rate, chains=1, generator=rng):
+    '''
+    Same process as 'discrete_decay' for 'chains' independent sources at once. The number of decays in a time step is
+    drawn as Binomial(nuclei left, decay_rate), so the cost per step does not depend on the number of nuclei.
+    Returns an array of shape (steps + 1, chains) with the nuclei left, until every chain has decayed completely.
+    '''
+    nuclei_left = np.full(chains, initial_nuclei, dtype=np.int64)
+    nuclei_time = [nuclei_left]
+    while np.any(nuclei_left > 0):
+        nuclei_left = nuclei_left - generator.binomial(nuclei_left, decay_rate)
+        nuclei_time.append(nuclei_left)
+    return np.array(nuclei_time)
+
+
+def gillespie_decay(initial_nuclei, decay_rates, times, chains=1, generator=rng):
+    '''
+    Continuous time decay series A_0 -> A_1 -> ... -> A_k (stable) with decay constants decay_rates[i] of A_i,
+    simulated exactly event by event (Gillespie's direct method) for 'chains' independent sources at once: the time to
+    the next decay is exponential with the total rate, and the decaying species is chosen with probability proportional
+    to its partial rate.
+    Returns the populations of all the species at the given (increasing) times, with shape (times, chains, k + 1).
+    '''
+    rates = np.asarray(decay_rates, dtype=float)
+    times = np.asarray(times, dtype=float)
+    populations = np.zeros((chains, np.size(rates) + 1), dtype=np.int64)
+    populations[:, 0] = initial_nuclei
+    recorded = np.empty((np.size(times), chains, np.size(rates) + 1), dtype=np.int64)
+    next_record = np.zeros(chains, dtype=int)  # Index of the next time to be recorded for every chain.
+    now = np.zeros(chains)
+    while True:
+        partial_rates = populations[:, :-1] * rates
+        total_rate = np.sum(partial_rates, axis=1)
+        with np.errstate(divide='ignore'):
+            event_time = now + generator.exponential(size=chains) / total_rate  # Infinite once all nuclei are stable.
+        # The populations do not change between events: record them for all the times before the next event.
+        pending = (next_record < np.size(times))
+        pending[pending] = times[next_record[pending]] < event_time[pending]
+        while np.any(pending):
+            recorded[next_record[pending], pending] = populations[pending]
+            next_record[pending] += 1
+            pending[pending] = next_record[pending] < np.size(times)
+            pending[pending] = times[next_record[pending]] < event_time[pending]
+        running = next_record < np.size(times)
+        if not np.any(running):
+            return recorded
+        threshold = total_rate[running] * generator.random(np.sum(running))
+        species = np.argmax(np.cumsum(partial_rates[running], axis=1) > threshold[:, np.newaxis], axis=1)
+        populations[running, species] -= 1
+        populations[running, species + 1] += 1
+        now[running] = event_time[running]
+
+
+def exact_decay(initial_nuclei, decay_rates, times, chains=1, generator=rng):
+    '''
+    Same continuous time decay series as 'gillespie_decay', sampled exactly only at the given times. Nuclei decay
+    independently, so the nuclei of species i at one time are distributed among the species at the next time with a
+    multinomial law whose probabilities are given by the matrix exponential of the rate matrix (Bateman's solution).
+    The cost does not depend on the number of nuclei, which allows sources of 10^12 nuclei and more.
+    Returns the populations with shape (times, chains, k + 1).
+    '''
+    rates = np.asarray(decay_rates, dtype=float)
+    rate_matrix = np.diag(np.append(-rates, 0.)) + np.diag(rates, k=1)
+    populations = np.zeros((chains, np.size(rates) + 1), dtype=np.int64)
+    populations[:, 0] = initial_nuclei
+    recorded = [populations]
+    for interval in np.diff(np.asarray(times, dtype=float)):
+        transition = np.clip(expm(rate_matrix * interval), 0., 1.)
+        transition /= np.sum(transition, axis=1, keepdims=True)
+        new_populations = np.zeros_like(populations)
+        for i in range(np.size(rates)):  # The stable species does not move.
+            new_populations[:, i:] += generator.multinomial(populations[:, i], transition[i, i:])
+        new_populations[:, -1] += populations[:, -1]
+        populations = new_populations
+        recorded.append(populations)
+    return np.array(recorded)
+
+
 def main():
     decay_rate = 0.03
     if args.part_b:
         decay_rate = 0.3
-    nuclei_sample = [10**(i+1) for i in range(5)]
-    for initial_nuclei in nuclei_sample:
-        nuclei_time = discrete_decay(initial_nuclei, decay_rate)
-        t = range(np.size(nuclei_time))
-        continuous_decay = initial_nuclei * np.exp(-decay_rate * np.array(t))
-        plt.plot(t, np.log(nuclei_time), label='$N_{0} = $' + f'{initial_nuclei:,.0f}')
-        plt.plot(t, np.log(continuous_decay))
-    plt.title(f'Radioactive decay for a decay rate of $ \\lambda = {decay_rate}$ per second')
+    decay_rates = [decay_rate] if not args.rates else [float(rate) for rate in args.rates.split(',')]
+    nuclei_sample = [10**(i+1) for i in range(args.largest)]
+    series = args.mode in ('gillespie', 'exact')
+    # The discrete modes simulate a separate source for every rate; the continuous ones the whole decay series, whose
+    # parent decays with the first rate.
+    for rate in decay_rates[:1] if series else decay_rates:
+        rate_label = f', $\\lambda = {rate}$' if len(decay_rates) > 1 and not series else ''
+        for initial_nuclei in nuclei_sample:
+            if args.mode == 'discrete':
+                nuclei_time = discrete_decay(initial_nuclei, rate)
+            elif args.mode == 'binomial':
+                nuclei_time = binomial_decay(initial_nuclei, rate, args.chains)[:, 0]
+            else:
+                times = np.arange(int(1.5 * np.log(initial_nuclei) / np.min(decay_rates)) + 2)
+                decay_model = gillespie_decay if args.mode == 'gillespie' else exact_decay
+                populations = decay_model(initial_nuclei, decay_rates, times, args.chains)[:, 0]
+                nuclei_time = populations[:, 0]
+                for i in range(1, np.size(decay_rates)):  # Daughters of the decay series.
+                    plt.plot(times, np.log(populations[:, i]), '--', label=f'$A_{i}$, ' + '$N_{0} = $'
+                             + f'{initial_nuclei:,.0f}')
+            t = range(np.size(nuclei_time))
+            continuous_decay = initial_nuclei * np.exp(-rate * np.array(t))
+            plt.plot(t, np.log(nuclei_time), label='$N_{0} = $' + f'{initial_nuclei:,.0f}' + rate_label)
+            plt.plot(t, np.log(continuous_decay))
+    if len(decay_rates) == 1:
+        plt.title(f'Radioactive decay for a decay rate of $ \\lambda = {decay_rates[0]}$ per second')
+    else:
+        plt.title(f'Radioactive decay{" series" * series} for decay rates of $ \\lambda = '
+                  f'{", ".join(map(str, decay_rates))}$ per second')
     plt.xlabel('Time (in seconds)')
     plt.ylabel('$ \\log{N(t)}$')
     plt.legend()
@@ -41,6 +140,14 @@ def main():
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--part_b', default=False, action="store_true", help="Obtain results for part b)")
+    parser.add_argument('--mode', type=str, default='discrete', choices=['discrete', 'binomial', 'gillespie', 'exact'],
+                        help="Decay model: one random number per nucleus, one binomial draw per step, continuous "
+                             "time event by event, or continuous time sampled exactly at integer times")
+    parser.add_argument('--rates', type=str, default='',
+                        help="Comma separated decay constants: one source per rate (discrete, binomial) or a decay "
+                             "series A_0 -> A_1 -> ... (gillespie, exact)")
+    parser.add_argument('--chains', type=int, default=1, help="Independent sources simulated together")
+    parser.add_argument('--largest', type=int, default=5, help="Largest N_0 is 10^largest")
     parser.add_argument('--save', default=False, action="store_true", help="Save plots instead of showing them")
     args = parser.parse_args()
     main()
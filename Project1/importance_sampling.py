@@ -0,0 +1,129 @@
+import time
+import numpy as np
+
+'''
+Importance sampling of one dimensional integrals I = int f(x) dx = E_g[f(x)/g(x)].
+
+Integrands and sampling densities are registered by name, so that candidate densities can be compared without editing
+the code that runs them:
+    -An integrand is a vectorized function f(x).
+    -A sampling density g(x) supplies its pdf together with a vectorized sampler, built either from its inverse CDF
+     ('inverse_cdf_density') or from an alias table over a tabulated, piecewise constant density ('alias_density').
+'compare' evaluates many (integrand, density) pairs in a single batched pass and reports, for every pair, the variance
+of f/g per sample and the time needed to reach a given standard error.
+'''
+
+integrands = {}
+densities = {}
+
+
+class SamplingDensity:
+    def __init__(self, pdf, sampler):
+        self.pdf = pdf  # Vectorized g(x).
+        self.sampler = sampler  # sampler(generator, shape) returns an array of the given shape distributed as g(x).
+
+    def sample(self, generator, shape):
+        return self.sampler(generator, shape)
+
+
+def register_integrand(name):
+    def decorator(function):
+        integrands[name] = function
+        return function
+    return decorator
+
+
+def register_density(name, density):
+    densities[name] = density
+    return density
+
+
+def inverse_cdf_density(pdf, inverse_cdf):
+    return SamplingDensity(pdf, lambda generator, shape: inverse_cdf(generator.random(shape)))
+
+
+def alias_density(weights, a=0., b=1.):
+    '''
+    Piecewise constant density on [a, b] with bins of equal width and probabilities proportional to 'weights'. The bin
+    of every sample is chosen in O(1) with Walker's alias table (built here with Vose's method).
+    '''
+    weights = np.asarray(weights, dtype=float)
+    bins = np.size(weights)
+    width = (b - a) / bins
+    probability = weights / np.sum(weights)
+    scaled = bins * probability
+    threshold = np.ones(bins)
+    alias = np.arange(bins)
+    small = [i for i in range(bins) if scaled[i] < 1.]
+    large = [i for i in range(bins) if scaled[i] >= 1.]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        threshold[less] = scaled[less]
+        alias[less] = more
+        scaled[more] -= 1. - scaled[less]
+        (small if scaled[more] < 1. else large).append(more)
+
+    def sampler(generator, shape):
+        column = generator.integers(bins, size=shape)
+        chosen = np.where(generator.random(shape) < threshold[column], column, alias[column])
+        return a + width * (chosen + generator.random(shape))
+
+    def pdf(x):
+        index = np.clip(((x - a) / width).astype(np.intp), 0, bins - 1)
+        return probability[index] / width
+
+    return SamplingDensity(pdf, sampler)
+
+
+register_density('uniform', inverse_cdf_density(lambda x: np.ones_like(x), lambda u: u))
+
+
+def compare(pairs, samples, replicates=1, target_error=1e-4, generator=None, max_bytes=2**27):
+    '''
+    Estimate the integral for every (integrand, density) pair of registered names in 'pairs', using 'replicates'
+    independent sets of 'samples' points. Points are drawn once per density, in chunks of at most 'max_bytes' bytes,
+    and shared by all the integrands paired with it.
+    Returns one dictionary per pair with the estimate, its standard error (averaged over the replicates), the variance
+    of f/g per sample, the time per sample and the time to reach a standard error of 'target_error'.
+    '''
+    if generator is None:
+        generator = np.random.default_rng()
+    by_density = {}
+    for integrand_name, density_name in pairs:
+        by_density.setdefault(density_name, []).append(integrand_name)
+
+    results = {}
+    chunk = max(1, min(samples, max_bytes // (8 * replicates)))
+    for density_name, integrand_names in by_density.items():
+        density = densities[density_name]
+        sums = np.zeros((len(integrand_names), replicates))
+        sqr_sums = np.zeros((len(integrand_names), replicates))
+        draw_time = 0.
+        evaluation_time = np.zeros(len(integrand_names))
+        for done in range(0, samples, chunk):
+            start = time.perf_counter()
+            x = density.sample(generator, (replicates, min(chunk, samples - done)))
+            g = density.pdf(x)
+            draw_time += time.perf_counter() - start
+            for i, integrand_name in enumerate(integrand_names):
+                start = time.perf_counter()
+                weights = integrands[integrand_name](x) / g
+                sums[i] += np.sum(weights, axis=1)
+                sqr_sums[i] += np.einsum('ij,ij->i', weights, weights)
+                evaluation_time[i] += time.perf_counter() - start
+
+        averages = sums / samples
+        variances = np.maximum(sqr_sums / samples - averages ** 2, 0.) * samples / (samples - 1)
+        for i, integrand_name in enumerate(integrand_names):
+            variance = np.mean(variances[i])
+            time_per_sample = (draw_time / len(integrand_names) + evaluation_time[i]) / (samples * replicates)
+            results[(integrand_name, density_name)] = {
+                'integrand': integrand_name,
+                'density': density_name,
+                'estimate': np.mean(averages[i]),
+                'std_error': np.mean(np.sqrt(variances[i] / samples)),
+                'variance': variance,
+                'time_per_sample': time_per_sample,
+                'time_to_target': variance / target_error ** 2 * time_per_sample,
+            }
+    return [results[tuple(pair)] for pair in pairs]
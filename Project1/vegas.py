@@ -0,0 +1,83 @@
+import numpy as np
+
+'''
+Adaptive Monte-Carlo integration in d dimensions with the VEGAS algorithm (G. P. Lepage, J. Comput. Phys. 27, 1978).
+
+The sampling density is separable, g(x) = g_1(x_1) ... g_d(x_d), and every g_i is piecewise constant on a grid whose
+bins carry equal probability. After each iteration the bins of every axis are resized so that regions where |f| is
+large get smaller bins (more points), and the estimates of all the iterations are combined weighting them by the
+inverse of their variance.
+'''
+
+
+def refine_grid(edges, weights, alpha):
+    # New edges of one axis such that every bin holds the same amount of the (smoothed, damped) weights.
+    bins = np.size(weights)
+    smoothed = np.empty(bins)
+    smoothed[0] = (7. * weights[0] + weights[1]) / 8.
+    smoothed[-1] = (weights[-2] + 7. * weights[-1]) / 8.
+    smoothed[1:-1] = (weights[:-2] + 6. * weights[1:-1] + weights[2:]) / 8.
+    if np.sum(smoothed) <= 0.:
+        return edges
+    smoothed /= np.sum(smoothed)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        importance = np.where((smoothed > 0.) & (smoothed < 1.), ((smoothed - 1.) / np.log(smoothed)) ** alpha, 0.)
+    importance[smoothed >= 1.] = 1.
+    cumulative = np.concatenate(([0.], np.cumsum(importance)))
+    return np.interp(np.linspace(0., cumulative[-1], bins + 1), cumulative, edges)
+
+
+def vegas_iteration(integrand, edges, samples, generator, batch):
+    # One iteration with the current grid. Returns the estimate, its variance and the sum of (f/g)^2 in every bin.
+    dimension, bins = np.shape(edges)[0], np.shape(edges)[1] - 1
+    axes = np.arange(dimension)
+    widths = np.diff(edges, axis=1)
+    total = 0.
+    total_sqr = 0.
+    bin_weights = np.zeros((dimension, bins))
+    for done in range(0, samples, batch):
+        size = min(batch, samples - done)
+        y = bins * generator.random((size, dimension))
+        index = y.astype(np.intp)
+        x = edges[axes, index] + widths[axes, index] * (y - index)
+        jacobian = np.prod(bins * widths[axes, index], axis=1)  # 1/g(x)
+        weights = integrand(x) * jacobian
+        total += np.sum(weights)
+        total_sqr += np.dot(weights, weights)
+        for axis in range(dimension):
+            bin_weights[axis] += np.bincount(index[:, axis], weights=weights * weights, minlength=bins)
+    estimate = total / samples
+    variance = (total_sqr / samples - estimate ** 2) / (samples - 1)
+    return estimate, variance, bin_weights
+
+
+def vegas(integrand, lower, upper, samples, iterations=10, bins=50, alpha=1.5, warmup=2, generator=None,
+          batch=2**16):
+    '''
+    Integral of 'integrand' over the box [lower, upper] (sequences of length d). The integrand is called with arrays
+    of shape (n, d) holding at most 'batch' points and must return n values. The first 'warmup' iterations only adapt
+    the grid; the remaining ones are combined. Returns the estimate, its error and the chi^2 per degree of freedom of
+    the combined iterations (values much larger than 1 signal that the grid was not yet adapted).
+    '''
+    if iterations <= warmup:
+        raise ValueError(f'VEGAS needs more iterations ({iterations}) than warm-up iterations ({warmup}), which are '
+                         'not combined')
+    if generator is None:
+        generator = np.random.default_rng()
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+    edges = np.linspace(lower, upper, bins + 1, axis=1)
+    estimates = []
+    variances = []
+    for iteration in range(iterations):
+        estimate, variance, bin_weights = vegas_iteration(integrand, edges, samples, generator, batch)
+        if iteration >= warmup:
+            estimates.append(estimate)
+            variances.append(variance)
+        edges = np.array([refine_grid(edges[axis], bin_weights[axis], alpha) for axis in range(np.size(lower))])
+    estimates = np.array(estimates)
+    weights = 1. / np.maximum(np.array(variances), np.finfo(float).tiny)
+    integral = np.sum(weights * estimates) / np.sum(weights)
+    error = 1. / np.sqrt(np.sum(weights))
+    chi2_dof = np.sum(weights * (estimates - integral) ** 2) / max(np.size(estimates) - 1, 1)
+    return integral, error, chi2_dof
@@ -1,6 +1,23 @@
 import argparse
 import numpy as np
 import matplotlib.pyplot as plt
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from mocp.parallel import run_replicates, iter_replicates  # noqa: E402
+from mocp.accumulators import RunningStats, Observable  # noqa: E402
+from mocp.checkpoints import StateCache  # noqa: E402
+from mocp.reweighting import JointHistogram, reweight  # noqa: E402
+from mocp.telemetry import Telemetry, add_arguments  # noqa: E402
+from mocp.cache import ResultCache  # noqa: E402
+from mocp.snapshots import SnapshotStore  # noqa: E402
+from transfer_matrix import exact_observables  # noqa: E402
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional. Without it the table driven kernel runs as plain Python.
+    njit = None
 
 rng = np.random.default_rng(42)
 
@@ -39,7 +56,7 @@ def visualize_states(save_trials, saved_states):
     ax.set_xlabel('Spins')
     ax.set_ylabel('Number of trial')
     ax.set_aspect(0.9)
-    down_spins = [f'{state.count(-1)}/20' for state in saved_states]
+    down_spins = [f'{list(state).count(-1)}/20' for state in saved_states]
 
     counter = 0
     for state in saved_states:
@@ -64,7 +81,7 @@ def visualize_states(save_trials, saved_states):
     return
 
 
-def trial_spin_flips(state, thermal_energy, flips, h=0.):
+def trial_spin_flips(state, thermal_energy, flips, h=0., generator=rng):
     spins = np.size(state)
     energy = -1. * np.sum([state[i]*state[(i+1) % spins] for i in range(spins)]) - h*np.sum(state)
     energies = [energy]  # Keep track of the energy at each trial.
@@ -76,11 +93,12 @@ def trial_spin_flips(state, thermal_energy, flips, h=0.):
     pos_energy_differences = [delta_E for delta_E in energy_differences if delta_E > 0]
     acceptance_prob = [np.exp(-delta_E / thermal_energy) for delta_E in pos_energy_differences]
 
-    trials = rng.integers(low=0, high=spins, size=flips)  # Chosen spin sites to try to flip. 'high' is exclusive.
+    trials = generator.integers(low=0, high=spins, size=flips)  # Chosen spin sites to try to flip. 'high' is excl.
 
     for trial in trials:
         energy_difference = 2.*state[trial]*(state[(trial + 1) % spins] + state[trial - 1] + h)  # Modulo due to P.B.C.
-        if energy_difference > 0 and rng.random(1) > acceptance_prob[pos_energy_differences.index(energy_difference)]:
+        if (energy_difference > 0
+                and generator.random(1) > acceptance_prob[pos_energy_differences.index(energy_difference)]):
             energies.append(energy)
             magnetisation_values.append(magnetisation)
             continue
@@ -92,18 +110,303 @@ def trial_spin_flips(state, thermal_energy, flips, h=0.):
     return energies, magnetisation_values
 
 
+def metropolis_chain(state, sites, uniforms, acceptance, h, energy, magnetisation, energies, magnetisation_values):
+    '''
+    Kernel of 'trial_spin_flips_fast'. 'acceptance' is the flat table of Metropolis acceptance probabilities indexed by
+    2 * (neighbour_sum / 2 + 1) + (spin + 1) / 2. Works both on NumPy arrays (compiled with Numba) and on plain lists.
+    '''
+    spins = len(state)
+    for k in range(len(sites)):
+        i = sites[k]
+        spin = state[i]
+        neighbours = state[(i + 1) % spins] + state[i - 1]
+        if uniforms[k] < acceptance[2 * (neighbours // 2 + 1) + (spin + 1) // 2]:
+            state[i] = -spin
+            magnetisation -= 2 * spin
+            energy += 2. * spin * (neighbours + h)
+        energies[k] = energy
+        magnetisation_values[k] = magnetisation
+    return energy, magnetisation
+
+
+if njit is not None:
+    metropolis_chain = njit(metropolis_chain)
+
+
+def trial_spin_flips_fast(state, thermal_energy, flips, h=0., generator=rng, block=2**16):
+    '''
+    Same Markov chain as 'trial_spin_flips' for a state stored as an int8 NumPy array (changed in place). The acceptance
+    probabilities are tabulated once, the sites and uniform numbers are drawn in blocks of 'block' trials, and the
+    chain runs compiled with Numba when it is installed.
+    Returns arrays with the energy and magnetisation before the first trial and after every trial.
+    '''
+    spins = np.size(state)
+    energy = -float(np.dot(state, np.roll(state, -1))) - h * float(np.sum(state))
+    magnetisation = float(np.sum(state))
+    energies = np.empty(flips + 1)
+    magnetisation_values = np.empty(flips + 1)
+    energies[0] = energy
+    magnetisation_values[0] = magnetisation
+    acceptance = np.array([min(1., np.exp(-2. * spin * (neighbours + h) / thermal_energy))
+                           for neighbours in [-2, 0, 2] for spin in [-1, 1]])
+
+    for start in range(0, flips, block):
+        size = min(block, flips - start)
+        sites = generator.integers(low=0, high=spins, size=size)
+        uniforms = generator.random(size)
+        if njit is not None:
+            energy, magnetisation = metropolis_chain(state, sites, uniforms, acceptance, h, energy, magnetisation,
+                                                     energies[start + 1:], magnetisation_values[start + 1:])
+        else:  # Python lists are much faster than NumPy arrays for element by element access.
+            state_list = state.tolist()
+            energies_list = [0.] * size
+            magnetisation_list = [0.] * size
+            energy, magnetisation = metropolis_chain(state_list, sites.tolist(), uniforms.tolist(), acceptance.tolist(),
+                                                     h, energy, magnetisation, energies_list, magnetisation_list)
+            state[:] = state_list
+            energies[start + 1:start + 1 + size] = energies_list
+            magnetisation_values[start + 1:start + 1 + size] = magnetisation_list
+    return energies, magnetisation_values
+
+
+kernels = {'python': trial_spin_flips, 'table': trial_spin_flips_fast}
+
+
+def down_state(spins, kernel='python'):
+    # All spins pointing downwards, stored as the chosen kernel expects.
+    return [-1 for _ in range(spins)] if kernel == 'python' else -np.ones(spins, dtype=np.int8)
+
+
+def count_flips(telemetry, magnetisation_values):
+    # Trial and accepted flips of a series of magnetisations, one per trial after the first: every flip changes M.
+    if telemetry.enabled:
+        telemetry.count('trial_flips', np.size(magnetisation_values) - 1)
+        telemetry.count('accepted_flips', np.count_nonzero(np.diff(magnetisation_values)))
+
+
+def measure_spin_flips(state, thermal_energy, flips, h=0., interval=1, generator=rng, keep_series=False, block=2**16,
+                       telemetry=None):
+    '''
+    Run 'flips' trials with 'trial_spin_flips_fast' in blocks of 'block' trials and record the energy and the
+    magnetisation every 'interval' trials into online accumulators, so memory does not grow with 'flips'.
+    Returns the two 'Observable's (with a decimated time series if 'keep_series').
+    '''
+    telemetry = telemetry or Telemetry()
+    energy = Observable(interval, keep_series=keep_series)
+    magnetisation = Observable(interval, keep_series=keep_series)
+    for start in range(0, flips, block):
+        energies, magnetisation_values = trial_spin_flips_fast(state, thermal_energy, min(block, flips - start), h,
+                                                               generator)
+        count_flips(telemetry, magnetisation_values)
+        first = 0 if start == 0 else 1  # Every block starts with the last values of the previous one.
+        energy.record(energies[first:])
+        magnetisation.record(magnetisation_values[first:])
+    return energy, magnetisation
+
+
+def equilibrium_task(generator, spins, thermal_energy, h, flips, kernel='python', interval=1, checkpoints=None,
+                     replica=0, anneal=False, warm_flips=100, telemetry=None):
+    '''
+    A single simulation with its own random stream, for 'run_replicates': 'flips' trials to reach equilibrium from the
+    all-down state and 'flips' more to measure (every 'interval' trials). Returns the time averages of E, of the
+    specific heat estimate (<E^2> - <E>^2)/(kT)^2 and of M, and the errors of the averages of E and M, which account
+    for the autocorrelation of the chain.
+    With a 'checkpoints' directory the equilibrated state of this (kT, h, replica) is saved and reused by later runs,
+    which skip the equilibration, and results already measured with the same parameters are returned directly. With
+    'anneal' a simulation without a saved state starts from the one of the closest temperature in the directory and
+    only needs 'warm_flips' trials to equilibrate.
+    A 'Telemetry' gets the equilibration and measurement times, the trial and accepted flips and the random numbers
+    drawn.
+    '''
+    telemetry = telemetry or Telemetry()
+    generator = telemetry.counting(generator)
+    cache = StateCache(checkpoints) if checkpoints else None
+    parameters = {'flips': flips, 'kernel': kernel, 'interval': interval}
+    entry = cache.load('ising1d', spins, thermal_energy, h, replica) if cache else None
+    results = StateCache.resume(entry, parameters, generator)
+    if results is not None:
+        return results
+    neighbour = cache.nearest('ising1d', spins, thermal_energy, h, replica) if cache and anneal else None
+    state = down_state(spins, kernel)
+    if entry is not None or neighbour is not None:  # Warm start.
+        state[:] = (entry if entry is not None else neighbour)['state'].tolist()
+    if entry is None:
+        with telemetry.phase('equilibration'):
+            _, magnetisation_values = kernels[kernel](state, thermal_energy, flips if neighbour is None else warm_flips,
+                                                      h, generator)
+        count_flips(telemetry, magnetisation_values)
+        if cache:
+            cache.save('ising1d', spins, thermal_energy, h, state, generator, replica)
+    with telemetry.phase('measurement'):
+        if kernel == 'table':
+            energy, magnetisation = measure_spin_flips(state, thermal_energy, flips, h, interval, generator,
+                                                       telemetry=telemetry)
+        else:
+            energy, magnetisation = Observable(interval), Observable(interval)
+            energies, magnetisation_values = trial_spin_flips(state, thermal_energy, flips, h, generator)
+            energy.record(energies)
+            magnetisation.record(magnetisation_values)
+            count_flips(telemetry, magnetisation_values)
+    specific_heat = energy.stats.m2 / energy.stats.count / (thermal_energy ** 2)
+    results = (energy.stats.mean, specific_heat, magnetisation.stats.mean, energy.binning.error,
+               magnetisation.binning.error)
+    if cache:
+        cache.save('ising1d', spins, thermal_energy, h, state, generator, replica, results, parameters)
+    return results
+
+
+def chain_energy(states, h=0.):
+    # Energy of every chain (last axis) with periodic boundary conditions.
+    return -np.sum(states * np.roll(states, -1, axis=-1), axis=-1) - h * np.sum(states, axis=-1)
+
+
+def sublattice_sweeps(states, thermal_energies, h, sweeps, generator=rng):
+    '''
+    Heat-bath sweeps of many independent chains at once. 'states' is an int8 array of shape (replicas, spins), changed
+    in place, and every replica has its own kT and h (numbers or arrays of length replicas). In every sweep all the
+    even sites are updated simultaneously and then all the odd sites: with an even number of spins and periodic
+    boundary conditions, the sites of one sublattice are not neighbours of each other. Metropolis acceptance would flip
+    every site with dE = 0 at once, moving the domain walls in straight lines; heat-bath acceptance keeps the chain
+    ergodic.
+    Returns the energies and magnetisations of every replica before the first sweep and after each sweep, with shape
+    (sweeps + 1, replicas).
+    '''
+    replicas, spins = np.shape(states)
+    if spins % 2:
+        raise ValueError('Sublattice sweeps need an even number of spins')
+    beta = 1. / np.broadcast_to(np.asarray(thermal_energies, dtype=float), (replicas,))[:, np.newaxis]
+    h = np.broadcast_to(np.asarray(h, dtype=float), (replicas,))[:, np.newaxis]
+    energies = np.empty((sweeps + 1, replicas))
+    magnetisation_values = np.empty((sweeps + 1, replicas))
+    energies[0] = chain_energy(states, h[:, 0])
+    magnetisation_values[0] = np.sum(states, axis=1)
+    even, odd = states[:, 0::2], states[:, 1::2]  # Views: updating them updates 'states'.
+    for sweep in range(sweeps):
+        # Even site 2k has neighbours odd[k - 1] and odd[k]; odd site 2k + 1 has neighbours even[k] and even[k + 1].
+        for spin, other, shift in ((even, odd, 1), (odd, even, -1)):
+            energy_difference = 2. * spin * (other + np.roll(other, shift, axis=1) + h)
+            flip = generator.random(np.shape(spin)) < 1. / (1. + np.exp(beta * energy_difference))
+            spin[flip] *= -1
+        energies[sweep + 1] = chain_energy(states, h[:, 0])
+        magnetisation_values[sweep + 1] = np.sum(states, axis=1)
+    return energies, magnetisation_values
+
+
+def replica_equilibrium(spins, thermal_energies, h_values, simulations, flips, interval=1, telemetry=None):
+    '''
+    Same measurement as 'equilibrium_task' for every (h, kT, simulation) at once with 'sublattice_sweeps', using as
+    many sweeps as 'flips' single spin trials and measuring every 'interval' sweeps. Returns an array of shape
+    (len(h_values), len(thermal_energies), simulations, 5).
+    '''
+    telemetry = telemetry or Telemetry()
+    generator = telemetry.counting(rng)
+    grid_h, grid_kt, _ = np.meshgrid(h_values, thermal_energies, np.arange(simulations), indexing='ij')
+    states = -np.ones((np.size(grid_kt), spins), dtype=np.int8)
+    sweeps = max(1, flips // spins)
+    with telemetry.phase('equilibration'):
+        sublattice_sweeps(states, grid_kt.ravel(), grid_h.ravel(), sweeps, generator)
+    with telemetry.phase('measurement'):
+        energies, magnetisation_values = sublattice_sweeps(states, grid_kt.ravel(), grid_h.ravel(), sweeps, generator)
+    telemetry.count('trial_flips', 2 * sweeps * np.size(states))  # Equilibration and measurement.
+    energy = Observable(interval, shape=np.size(grid_kt))
+    magnetisation = Observable(interval, shape=np.size(grid_kt))
+    energy.record(energies)
+    magnetisation.record(magnetisation_values)
+    specific_heat = energy.stats.m2 / energy.stats.count / grid_kt.ravel() ** 2
+    results = np.stack([energy.stats.mean, specific_heat, magnetisation.stats.mean, energy.binning.error,
+                        magnetisation.binning.error], axis=-1)
+    return np.reshape(results, np.shape(grid_kt) + (5,))
+
+
+def equilibrium_grid(spins, thermal_energies, h_values, simulations, flips=1000):
+    # Results of 'equilibrium_task' for every (h, kT, simulation), with the engine chosen in the command line.
+    # Returns an array of shape (len(h_values), len(thermal_energies), simulations, 5).
+    if args.sublattice:
+        return replica_equilibrium(spins, thermal_energies, h_values, simulations, flips, args.interval, telemetry)
+    arguments = [(spins, thermal_energy, h_field, flips, args.kernel, args.interval, args.checkpoints, replica,
+                  args.anneal, args.warm_flips)
+                 for h_field in h_values for thermal_energy in thermal_energies for replica in range(simulations)]
+    results = np.empty((len(arguments), 5))
+    if args.workers:
+        # Blocks of simulations come back in order as they finish; the tasks in other processes are not instrumented.
+        for start, block in iter_replicates(equilibrium_task, len(arguments), arguments, workers=args.workers):
+            results[start:start + len(block)] = block
+            telemetry.progress('simulations', start + len(block), len(arguments), unit='simulations')
+    else:
+        telemetry.progress('simulations', 0, len(arguments), unit='simulations')
+        for i, task_arguments in enumerate(arguments):
+            results[i] = equilibrium_task(rng, *task_arguments, telemetry=telemetry)
+            if (i + 1) % simulations == 0:  # After every (h, kT).
+                telemetry.progress('simulations', i + 1, len(arguments), unit='simulations', h=task_arguments[2],
+                                   kT=task_arguments[1])
+    return np.reshape(results, (len(h_values), len(thermal_energies), simulations, 5))
+
+
+def series_task(generator, spins, thermal_energy, h, flips, kernel='python'):
+    # Energy and magnetisation after every trial of the measurement run of 'equilibrium_task', for the histograms.
+    state = down_state(spins, kernel)
+    kernels[kernel](state, thermal_energy, flips, h, generator)
+    return np.array(kernels[kernel](state, thermal_energy, flips, h, generator), dtype=float)
+
+
+def reweighted_curves(spins, thermal_energies, h, simulations, temperatures, flips=1000):
+    '''
+    Multi-histogram reweighting of 'simulations' runs at every kT of 'thermal_energies' (all with field h). Returns the
+    observables of 'mocp.reweighting.reweight' (values and jackknife errors) at every kT of 'temperatures', and at the
+    simulated ones.
+    '''
+    arguments = [(spins, thermal_energy, h, flips, args.kernel) for thermal_energy in thermal_energies
+                 for _ in range(simulations)]
+    with telemetry.phase('simulation'):
+        if args.workers:
+            series = run_replicates(series_task, len(arguments), arguments, workers=args.workers)
+        else:
+            series = np.empty((len(arguments), 2, flips + 1))
+            for i, task_arguments in enumerate(arguments):
+                series[i] = series_task(rng, *task_arguments)
+                if (i + 1) % simulations == 0:
+                    telemetry.progress(f'simulations at h = {h:g}', i + 1, len(arguments), unit='simulations')
+    with telemetry.phase('reweighting'):
+        histograms = []
+        for runs in np.reshape(series, (len(thermal_energies), simulations, 2, flips + 1)):
+            histograms.append(JointHistogram(simulations * (flips + 1), field=h))
+            for energies, magnetisation_values in runs:
+                histograms[-1].record(energies, magnetisation_values)
+        curves = reweight(histograms, 1. / np.asarray(thermal_energies, dtype=float),
+                          1. / np.concatenate([temperatures, thermal_energies]), spins)
+    dense = slice(0, len(temperatures))
+    simulated = slice(len(temperatures), None)
+    return ({name: (values[dense], errors[dense]) for name, (values, errors) in curves.items()},
+            {name: (values[simulated], errors[simulated]) for name, (values, errors) in curves.items()})
+
+
+def cached(function, *arguments):
+    # 'function(*arguments)' through the --cache directory, keyed also by the flags that change the simulations. The
+    # arrays of a hit are memory-mapped, read only as they are used.
+    if not args.cache:
+        return function(*arguments)
+    flags = {name: value for name, value in vars(args).items()
+             if name not in ('save', 'part', 'cache', 'cache_size', 'telemetry', 'profile', 'trace_memory')}
+    return ResultCache(args.cache, args.cache_size * 2**20).call(function, *arguments, parameters=flags, generator=rng,
+                                                                 mmap_mode='r')
+
+
 def part_a(spins):
-    state = [-1 for _ in range(spins)]  # All spins initially pointing in the same direction. Here it is downwards.
+    state = down_state(spins, args.kernel)  # All spins initially pointing in the same direction. Here it is downwards.
     thermal_energy = 1.
     save_trials = [0, 5, 50, 100, 200, 300, 350, 400, 450, 500]  # Chosen times to visualize the system.
-    saved_states = [state.copy()]  # Save states at the given 'save_trials' numbers to be plotted later.
+    saved_states = [np.array(state)]  # Save states at the given 'save_trials' numbers to be plotted later.
     flips_done = 0
     for number in save_trials:
         if number == 0:
             continue
-        trial_spin_flips(state, thermal_energy, flips=number-flips_done)
-        saved_states.append(state.copy())
+        spin_flips(state, thermal_energy, flips=number-flips_done)
+        saved_states.append(np.array(state))
         flips_done = number
+    if args.snapshots:  # Every run adds its states to the series.
+        with SnapshotStore(args.snapshots) as store:
+            store.extend('ising1d-part_a', saved_states,
+                         attributes={'trials': save_trials, 'thermal_energy': thermal_energy})
     visualize_states(save_trials, saved_states)
     return
 
@@ -113,8 +416,8 @@ def part_b(spins):
     flips = 1000
     colors = ['darkviolet', 'orange', 'red']
     for i in range(np.size(thermal_energies)):
-        state = [-1 for _ in range(spins)]  # All spins initially pointing in the same direction (here downwards).
-        energies, _ = trial_spin_flips(state, thermal_energies[i], flips)
+        state = down_state(spins, args.kernel)  # All spins initially pointing in the same direction (here downwards).
+        energies, _ = spin_flips(state, thermal_energies[i], flips)
         t = np.linspace(0, flips, num=np.size(energies), endpoint=True)
         plt.plot(t, energies, label='$k_{B}T =$' + f'{thermal_energies[i]}', color=colors[i])
     plt.xlabel('Time (in single trials for spin flip)')
@@ -130,16 +433,14 @@ def part_b(spins):
     simulations = 100
 
     for i in range(np.size(thermal_energies)):
-        simulation_energy = []
+        simulation_energy = RunningStats(shape=flips + 1)  # Mean over the simulations at every time.
         for j in range(simulations):
-            state = [-1 for _ in range(spins)]
-            energies, _ = trial_spin_flips(state, thermal_energies[i], flips)
-            simulation_energy.append(energies)
-        t = np.linspace(0, flips, num=np.shape(simulation_energy)[1], endpoint=True)
-        averaged_energies = np.mean(simulation_energy, axis=0)
-        squared_energies = [[energy ** 2 for energy in energies] for energies in simulation_energy]
-        averaged_squared_energies = np.mean(squared_energies, axis=0)
-        monte_carlo_error = np.sqrt((averaged_squared_energies - averaged_energies ** 2) / simulations)
+            state = down_state(spins, args.kernel)
+            energies, _ = spin_flips(state, thermal_energies[i], flips)
+            simulation_energy.update(np.asarray(energies)[np.newaxis])
+        t = np.linspace(0, flips, num=flips + 1, endpoint=True)
+        averaged_energies = simulation_energy.mean
+        monte_carlo_error = simulation_energy.std_error
         plt.plot(t, averaged_energies, label='$k_{B}T =$' + f'{thermal_energies[i]}', color=colors[i])
         plt.fill_between(t, averaged_energies - monte_carlo_error, averaged_energies + monte_carlo_error,
                          color=colors[i], alpha=0.3)
@@ -169,54 +470,59 @@ def main():
         spins = 20  # Number of spins in the system
         thermal_energies = [i+1 for i in range(10)]  # Choose kT = 1, 2, ..., 10
         simulations = 100  # Number of independent simulations for each thermal energy
-        avg_energy_particle = []
-        specific_heat_particle = []
-        for thermal_energy in thermal_energies:
-            time_avg_energies = []
-            specific_heats = []
-            for _ in range(simulations):
-                state = [-1 for _ in range(spins)]
-                trial_spin_flips(state, thermal_energy, flips=1000)  # Run the initial state for 1000 flips first.
-                energies, _ = trial_spin_flips(state, thermal_energy, flips=1000)  # Now get the energies after eq.
-                average_energy = np.mean(energies)
-                average_squared_energy = np.mean(np.array(energies) ** 2)
-                specific_heat = (average_squared_energy - average_energy**2)/(thermal_energy**2)
-                time_avg_energies.append(average_energy)
-                specific_heats.append(specific_heat)
-            avg_energy_particle.append(np.mean(time_avg_energies)/spins)
-            specific_heat_particle.append(np.mean(specific_heats)/spins)
-
         temperatures = np.linspace(np.min(thermal_energies), np.max(thermal_energies), num=100)
-        if args.part == 'c':
-            plt.plot(thermal_energies, avg_energy_particle, 'o', color='b', label='Simulated values')
-            plt.plot(temperatures, -np.tanh(1/temperatures), color='r',
-                     label='$-J \\cdot \\tanh{\\frac{J}{k_{B}T}}$')
-            ax = plt.gca()
-            ax.set_xticks(np.arange(1, 11, 1.0))
-            plt.xlabel('$k_{B}T$ (in units of $J$)')
-            plt.ylabel('$\\frac{1}{N} \\langle E \\rangle_{t}$ (in units of $J$)')
-            plt.legend()
-            if args.save:
-                plt.savefig(f'P2-1{args.part}.png', dpi=1200)
-            else:
-                plt.title('Mean energy per particle over 1,000 trial spin flips, after \n '
-                          f'equilibrium has been reached, for {simulations:,.0f} simulations each')
-                plt.show()
+        if args.reweight:  # Simulate every third temperature only and reweight their histograms.
+            thermal_energies = thermal_energies[::3]
+            curves, points = cached(reweighted_curves, spins, thermal_energies, 0., simulations, temperatures)
+            avg_energy_particle, energy_error_particle = points['energy']
+            specific_heat_particle = points['specific_heat'][0]
+            observable = 'energy' if args.part == 'c' else 'specific_heat'
+            plt.plot(temperatures, curves[observable][0], color='g', label='Reweighted')
+            plt.fill_between(temperatures, curves[observable][0] - curves[observable][1],
+                             curves[observable][0] + curves[observable][1], color='g', alpha=0.3)
         else:
-            plt.plot(thermal_energies, specific_heat_particle, 'o', color='b', label='Simulated values')
-            plt.plot(temperatures, 1/((temperatures**2) * (np.cosh(1/temperatures))**2), color='r',
-                     label='Thermodynamic limit')
-            ax = plt.gca()
-            ax.set_xticks(np.arange(1, 11, 1.0))
-            plt.xlabel('$k_{B}T$ (in units of $J$)')
-            plt.ylabel('$c_{V}/k_{B}$')
-            plt.legend()
-            if args.save:
-                plt.savefig(f'P2-1{args.part}.png', dpi=1200)
+            results = cached(equilibrium_grid, spins, thermal_energies, [0.], simulations)[0]
+            avg_energy_particle = np.mean(results[:, :, 0], axis=1) / spins
+            specific_heat_particle = np.mean(results[:, :, 1], axis=1) / spins
+            # Independent simulations: the errors of their time averages add in quadrature.
+            energy_error_particle = np.sqrt(np.sum(results[:, :, 3] ** 2, axis=1)) / (simulations * spins)
+
+        with telemetry.phase('plotting'):
+            if args.part == 'c':
+                plt.errorbar(thermal_energies, avg_energy_particle, yerr=energy_error_particle, fmt='o', color='b',
+                             label='Simulated values')
+                plt.plot(temperatures, -np.tanh(1/temperatures), color='r',
+                         label='$-J \\cdot \\tanh{\\frac{J}{k_{B}T}}$')
+                plt.plot(temperatures, exact_observables(spins, temperatures)['energy'], '--', color='k',
+                         label=f'Exact, $N = {spins}$')
+                ax = plt.gca()
+                ax.set_xticks(np.arange(1, 11, 1.0))
+                plt.xlabel('$k_{B}T$ (in units of $J$)')
+                plt.ylabel('$\\frac{1}{N} \\langle E \\rangle_{t}$ (in units of $J$)')
+                plt.legend()
+                if args.save:
+                    plt.savefig(f'P2-1{args.part}.png', dpi=1200)
+                else:
+                    plt.title('Mean energy per particle over 1,000 trial spin flips, after \n '
+                              f'equilibrium has been reached, for {simulations:,.0f} simulations each')
+                    plt.show()
             else:
-                plt.title('Specific heat per particle at constant volume over 1,000 trial spin \n '
-                          f'flips, after equilibrium has been reached, for {simulations:,.0f} simulations each')
-                plt.show()
+                plt.plot(thermal_energies, specific_heat_particle, 'o', color='b', label='Simulated values')
+                plt.plot(temperatures, 1/((temperatures**2) * (np.cosh(1/temperatures))**2), color='r',
+                         label='Thermodynamic limit')
+                plt.plot(temperatures, exact_observables(spins, temperatures)['specific_heat'], '--', color='k',
+                         label=f'Exact, $N = {spins}$')
+                ax = plt.gca()
+                ax.set_xticks(np.arange(1, 11, 1.0))
+                plt.xlabel('$k_{B}T$ (in units of $J$)')
+                plt.ylabel('$c_{V}/k_{B}$')
+                plt.legend()
+                if args.save:
+                    plt.savefig(f'P2-1{args.part}.png', dpi=1200)
+                else:
+                    plt.title('Specific heat per particle at constant volume over 1,000 trial spin \n '
+                              f'flips, after equilibrium has been reached, for {simulations:,.0f} simulations each')
+                    plt.show()
     elif args.part == 'e':
         spins = 20
         thermal_energies = [i + 1. for i in range(10)]  # Choose kT = 1, 2, ..., 10
@@ -224,31 +530,42 @@ def main():
         h_values = [0., 0.1, 1., 10.]
         temperatures = np.linspace(np.min(thermal_energies), np.max(thermal_energies), num=100)
         colors = ['red', 'salmon', 'dodgerblue', 'deepskyblue', 'forestgreen', 'limegreen', 'darkviolet', 'violet']
-        for h_field in h_values:
-            magnetisation_particle = []
-            for thermal_energy in thermal_energies:
-                simulations_avg_magnetisation = []
-                for simulation in range(simulations):
-                    state = [-1 for _ in range(spins)]
-                    trial_spin_flips(state, thermal_energy, flips=1000, h=h_field)  # Reach equilibrium
-                    _, magnetisation_values = trial_spin_flips(state, thermal_energy, flips=1000, h=h_field)
-                    simulations_avg_magnetisation.append(np.mean(magnetisation_values))
-                magnetisation_particle.append(np.mean(simulations_avg_magnetisation)/spins)
-            plt.plot(thermal_energies, magnetisation_particle, 'o', color=colors[2*h_values.index(h_field)],
-                     label=f'$H =$ {h_field}')
-            plt.plot(temperatures, analytical_magnetisation(temperatures, h_field),
-                     color=colors[2*h_values.index(h_field) + 1])
-        ax = plt.gca()
-        ax.set_xticks(np.arange(np.min(thermal_energies), np.max(thermal_energies)+1, 1))
-        plt.xlabel('$k_{B}T$ (in units of $J$)')
-        plt.ylabel('$m = \\langle M \\rangle / N$')
-        plt.legend()
-        if args.save:
-            plt.savefig(f'P2-1{args.part}.png', dpi=1200)
+        if args.reweight:  # Simulate every third temperature only and reweight their histograms.
+            thermal_energies = thermal_energies[::3]
+            magnetisation_grid, magnetisation_error_grid = [], []
+            for h_field in h_values:
+                curves, points = cached(reweighted_curves, spins, thermal_energies, h_field, simulations, temperatures)
+                magnetisation_grid.append(points['magnetisation'][0])
+                magnetisation_error_grid.append(points['magnetisation'][1])
+                magnetisation_curve, magnetisation_curve_error = curves['magnetisation']
+                plt.fill_between(temperatures, magnetisation_curve - magnetisation_curve_error,
+                                 magnetisation_curve + magnetisation_curve_error,
+                                 color=colors[2*h_values.index(h_field)], alpha=0.3)
         else:
-            plt.title('Mean magnetization per particle over 1,000 flip spin trials after \n '
-                      f'equilibrium has been reached and over {simulations:,.0f} simulations')
-            plt.show()
+            results = cached(equilibrium_grid, spins, thermal_energies, h_values, simulations)
+            magnetisation_grid = np.mean(results[..., 2], axis=2) / spins
+            magnetisation_error_grid = np.sqrt(np.sum(results[..., 4] ** 2, axis=2)) / (simulations * spins)
+        with telemetry.phase('plotting'):
+            for h_field in h_values:
+                magnetisation_particle = magnetisation_grid[h_values.index(h_field)]
+                magnetisation_error = magnetisation_error_grid[h_values.index(h_field)]
+                plt.errorbar(thermal_energies, magnetisation_particle, yerr=magnetisation_error, fmt='o',
+                             color=colors[2*h_values.index(h_field)], label=f'$H =$ {h_field}')
+                plt.plot(temperatures, analytical_magnetisation(temperatures, h_field),
+                         color=colors[2*h_values.index(h_field) + 1])
+                plt.plot(temperatures, exact_observables(spins, temperatures, h_field)['magnetisation'], '--',
+                         color='k', lw=0.8)  # Exact result for the finite chain.
+            ax = plt.gca()
+            ax.set_xticks(np.arange(np.min(thermal_energies), np.max(thermal_energies)+1, 1))
+            plt.xlabel('$k_{B}T$ (in units of $J$)')
+            plt.ylabel('$m = \\langle M \\rangle / N$')
+            plt.legend()
+            if args.save:
+                plt.savefig(f'P2-1{args.part}.png', dpi=1200)
+            else:
+                plt.title('Mean magnetization per particle over 1,000 flip spin trials after \n '
+                          f'equilibrium has been reached and over {simulations:,.0f} simulations')
+                plt.show()
     elif args.part == 'f':
         spins = 20
         state = rng.choice([-1, 1], size=spins)
@@ -260,6 +577,41 @@ def main():
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--save', default=False, action="store_true", help="Save plots generated instead of showing.")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Run the independent simulations of parts c) to e) on this many processes")
+    parser.add_argument('--kernel', type=str, default='python', choices=list(kernels),
+                        help="Spin flip kernel: the original list based one or the table driven one (uses Numba if "
+                             "available)")
+    parser.add_argument('--sublattice', default=False, action="store_true",
+                        help="Run all the simulations of parts c) to e) together as one array of replicas, with "
+                             "even/odd sublattice sweeps")
+    parser.add_argument('--interval', type=int, default=1,
+                        help="Measure every this many trial flips in parts c) to e) (sweeps with --sublattice)")
+    parser.add_argument('--checkpoints', type=str, default=None,
+                        help="Directory where the equilibrated states and results of parts c) to e) are saved, to "
+                             "skip the equilibration in later runs and resume interrupted ones")
+    parser.add_argument('--anneal', default=False, action="store_true",
+                        help="Start every temperature from the saved state of the closest one (needs --checkpoints)")
+    parser.add_argument('--warm_flips', type=int, default=100,
+                        help="Trial flips to equilibrate a state annealed from another temperature")
+    parser.add_argument('--reweight', default=False, action="store_true",
+                        help="In parts c) to e), simulate every third temperature only and draw the curves by "
+                             "multi-histogram reweighting, with jackknife error bands")
+    parser.add_argument('--snapshots', type=str, default=None,
+                        help="Directory where the states of part a) are stored, bit packed, appended to the series "
+                             "'ising1d-part_a'")
+    parser.add_argument('--cache', type=str, default=None,
+                        help="Directory where the results of parts c) to e) are cached, so that the plots can be "
+                             "redrawn (e.g. with --save, or part d after part c) without simulating again")
+    parser.add_argument('--cache_size', type=float, default=1024, help="Size limit of the --cache directory in MiB")
     parser.add_argument('--part', type=str, default='a', help="Choose the code for the given part to be executed.")
+    add_arguments(parser)
     args = parser.parse_args()
-    main()
+    if args.anneal and not args.checkpoints:
+        parser.error('--anneal needs --checkpoints')
+    if (args.checkpoints or args.reweight) and args.sublattice:
+        parser.error('--checkpoints and --reweight are not available with --sublattice')
+    spin_flips = kernels[args.kernel]
+    telemetry = Telemetry.from_args(args)
+    with telemetry:
+        main()
@@ -1,7 +1,20 @@
 import argparse
 import numpy as np
 import matplotlib.pyplot as plt
-import time
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from mocp.parallel import run_replicates, iter_replicates  # noqa: E402
+from mocp.checkpoints import StateCache  # noqa: E402
+from mocp.accumulators import Observable  # noqa: E402
+from mocp.tempering import parallel_tempering  # noqa: E402
+from mocp.reweighting import JointHistogram, reweight  # noqa: E402
+from mocp.telemetry import Telemetry, add_arguments  # noqa: E402
+from mocp.cache import ResultCache  # noqa: E402
+from mocp.snapshots import SnapshotStore  # noqa: E402
+from cluster_updates import wolff_update, swendsen_wang_sweeps  # noqa: E402
+from packed_lattice import PackedLattice, packed_sweeps  # noqa: E402
 
 rng = np.random.default_rng(42)
 
@@ -32,45 +45,356 @@ def get_acceptance_probabilities(beta):
     return pos_energy_diff, acceptance_prob
 
 
-def mc_step(state, pos_energy_diff, acceptance_prob):
-    trial_files = rng.integers(length, size=skip*spins)
-    trial_columns = rng.integers(length, size=skip*spins)
+def mc_step(state, pos_energy_diff, acceptance_prob, skip=10, generator=rng):
+    length = np.shape(state)[0]
+    trial_files = generator.integers(length, size=skip*np.size(state))
+    trial_columns = generator.integers(length, size=skip*np.size(state))
     for i, j in zip(trial_files, trial_columns):
         energy_difference = 2 * state[i, j] * (state[i, (j + 1) % length] + state[i, j - 1]
                                                + state[(i + 1) % length, j] + state[i - 1, j])
-        if energy_difference > 0 and rng.random(1) > acceptance_prob[pos_energy_diff.index(energy_difference)]:
+        if energy_difference > 0 and generator.random(1) > acceptance_prob[pos_energy_diff.index(energy_difference)]:
             continue
         state[i, j] *= -1
     return
 
 
+def acceptance_table(betas):
+    # Heat-bath acceptance probabilities 1 / (1 + exp(beta * dE)) of a flip with dE = 2 s (sum of the 4 neighbours),
+    # indexed by (s * sum + 4) // 2 = 0, ..., 4, for every beta: shape (..., 5). Metropolis, min(1, exp(-beta * dE)),
+    # would flip every spin of a colour with dE <= 0 at once, and at beta = 0 the whole sublattice at every half sweep,
+    # which is not ergodic.
+    betas = np.asarray(betas, dtype=float)[..., np.newaxis]
+    return 0.5 * (1. - np.tanh(betas * np.arange(-4, 5, 2)))
+
+
+def checkerboard_colours(length):
+    '''
+    Boolean masks of the colour classes of a colouring of the periodic L x L lattice in which no two neighbours have the
+    same colour. For even L it is the usual checkerboard. For odd L the checkerboard breaks across the boundary, so the
+    last row and the last column get two colours of their own and the corner a fifth one.
+    '''
+    i, j = np.indices((length, length))
+    colours = (i + j) % 2
+    if length % 2:
+        colours[-1, :] = 2 + j[-1] % 2
+        colours[:, -1] = 2 + i[:, -1] % 2
+        colours[-1, -1] = 4
+    return [colours == colour for colour in range(np.max(colours) + 1)]
+
+
+def checkerboard_sweeps(states, betas, sweeps=1, generator=rng):
+    '''
+    'sweeps' heat-bath sweeps over contiguous int8 lattices of shape (..., L, L), changed in place. The sites of one
+    colour (see 'checkerboard_colours') do not interact, so all of them are updated at once: the neighbour sums come
+    from rolled copies of the lattices, the acceptance probabilities from a table and the uniform numbers are drawn
+    for the whole colour class. 'betas' broadcast against the leading axes of 'states', so replicas at different
+    temperatures are swept together.
+    '''
+    length = np.shape(states)[-1]
+    lattices = states.reshape((-1, length, length))  # A view: the updates go to 'states'.
+    table = np.reshape(np.broadcast_to(acceptance_table(betas), np.shape(states)[:-2] + (5,)), (-1, 5))
+    replicas = np.arange(len(lattices))[:, np.newaxis]
+    masks = checkerboard_colours(length)
+    for _ in range(sweeps):
+        for mask in masks:
+            neighbours = (np.roll(lattices, 1, axis=1) + np.roll(lattices, -1, axis=1) + np.roll(lattices, 1, axis=2)
+                          + np.roll(lattices, -1, axis=2))[:, mask]
+            spins = lattices[:, mask]
+            # Single precision uniforms halve the memory traffic; their resolution (2^-24) is far below any bias we
+            # could measure.
+            flips = generator.random(np.shape(spins), dtype=np.float32) < table[replicas, (spins * neighbours + 4) // 2]
+            lattices[:, mask] = np.where(flips, -spins, spins)
+    return sweeps
+
+
+def metropolis_sweeps(state, beta, sweeps=1, generator=rng):
+    # The original random site update with the interface of 'checkerboard_sweeps' (a single lattice).
+    pos_energy_diff, acceptance_prob = get_acceptance_probabilities(beta)
+    mc_step(state, pos_energy_diff, acceptance_prob, sweeps, generator)
+    return sweeps
+
+
+# Every update is called as update(state, beta, steps, generator) and returns the work done in sweeps. A step is a
+# sweep, except for Wolff, where it is a single cluster.
+updates = {'metropolis': metropolis_sweeps, 'checkerboard': checkerboard_sweeps, 'wolff': wolff_update,
+           'swendsen-wang': swendsen_wang_sweeps, 'packed': packed_sweeps}
+
+
+def total_magnetisation(state):
+    # Sum of the spins of a lattice (or of every lattice of an array of shape (..., L, L)) or of a 'PackedLattice'.
+    return state.magnetisation() if isinstance(state, PackedLattice) else np.sum(state, axis=(-2, -1), dtype=np.int64)
+
+
+def magnetisation_per_spin(state):
+    # |M| / L^2, the quantity measured in the beta sweep.
+    length = state.length if isinstance(state, PackedLattice) else np.shape(state)[-1]
+    return np.abs(total_magnetisation(state)) / length ** 2
+
+
+def lattice_energy(state):
+    # E = -sum over the bonds of s_i s_j (J = 1) of a lattice, of every lattice of an array, or of a 'PackedLattice'.
+    if isinstance(state, PackedLattice):
+        return state.energy()
+    return -np.sum(state * (np.roll(state, 1, axis=-1) + np.roll(state, 1, axis=-2)), axis=(-2, -1), dtype=np.int64)
+
+
+def down_lattice(length, update='metropolis'):
+    # All spins pointing downwards, stored as the chosen update expects.
+    if update == 'packed':
+        return PackedLattice.filled(length)
+    return -np.ones((length, length), dtype=int if update == 'metropolis' else np.int8)
+
+
+def beta_task(generator, beta, length, configurations, skip, checkpoints=None, anneal=False, equilibration=0,
+              warm_equilibration=0, update='metropolis', snapshots=None, telemetry=None):
+    '''
+    Mean absolute magnetisation per spin at a single beta with its own random stream, for 'run_replicates', with 'skip'
+    steps of the chosen update between configurations. The first 'equilibration' configurations from the all-down
+    state are discarded. Returns <|m|>, its error and its integrated autocorrelation time in sweeps, both from a
+    binning analysis of the configurations (so the time is at least half the spacing between configurations).
+    With a 'checkpoints' directory the equilibrated state is saved (keyed by kT = 1/beta) and reused by later runs, and
+    a result already measured with the same parameters is returned directly. With 'anneal' a beta without a saved state
+    starts from the one of the closest beta in the directory and discards 'warm_equilibration' configurations instead.
+    With a 'snapshots' directory every measured configuration is stored, bit packed, in the series
+    'ising2d-L<length>-beta<beta>' of a 'SnapshotStore' (every run appends to it).
+    A 'Telemetry' gets the equilibration and measurement times, the progress of the measurement and, while measuring,
+    the sweeps, trial flips (single spin updates), spins changed between configurations (a lower bound of the accepted
+    flips) and random numbers drawn.
+    '''
+    telemetry = telemetry or Telemetry()
+    generator = telemetry.counting(generator)
+    thermal_energy = 1. / beta if beta else np.inf
+    cache = StateCache(checkpoints) if checkpoints else None
+    parameters = {'configurations': configurations, 'skip': skip, 'update': update}
+    entry = cache.load('ising2d', length, thermal_energy) if cache else None
+    result = StateCache.resume(entry, parameters, generator)
+    if result is not None:
+        return result
+    neighbour = cache.nearest('ising2d', length, thermal_energy) if cache and anneal else None
+    warm_start = entry if entry is not None else neighbour
+    if update == 'packed' and warm_start is not None:
+        state = PackedLattice.from_spins(warm_start['state'])
+    else:
+        state = down_lattice(length, update)
+        if warm_start is not None:
+            state[:] = warm_start['state']
+    if entry is None:
+        with telemetry.phase('equilibration'):
+            for _ in range(equilibration if neighbour is None else warm_equilibration):
+                updates[update](state, beta, skip, generator)
+        if cache:
+            cache.save('ising2d', length, thermal_energy, 0., state, generator)
+    # The sign of m is meaningless for cluster updates, which flip the whole lattice at once in the ordered phase.
+    magnetisation = Observable()
+    magnetisation.record([magnetisation_per_spin(state)])
+    work = 0.
+    store = SnapshotStore(snapshots) if snapshots else None
+    series = f'ising2d-L{length}-beta{float(beta)!r}'
+    telemetry.progress(f'beta = {beta:g}', 0, configurations, unit='configurations')
+    with telemetry.phase('measurement'):
+        for i in range(configurations):
+            previous = np.array(state) if telemetry.enabled else None
+            sweeps = updates[update](state, beta, skip, generator)
+            work += sweeps
+            magnetisation.record([magnetisation_per_spin(state)])
+            if store:
+                store.append(series, np.asarray(state), attributes={'beta': float(beta), 'length': length,
+                                                                    'update': update, 'skip': skip})
+            if telemetry.enabled:
+                telemetry.count('sweeps', sweeps)
+                if update not in ('wolff', 'swendsen-wang'):
+                    telemetry.count('trial_flips', sweeps * length ** 2)
+                telemetry.count('spins_changed', np.count_nonzero(np.array(state) != previous))
+                if (i + 1) % max(configurations // 10, 1) == 0 or i + 1 == configurations:
+                    telemetry.progress(f'beta = {beta:g}', i + 1, configurations, unit='configurations')
+    if store:
+        store.close()
+    result = np.array([magnetisation.stats.mean, magnetisation.binning.error,
+                       magnetisation.binning.tau_int * work / configurations])
+    if cache:
+        cache.save('ising2d', length, thermal_energy, 0., state, generator, results=result, parameters=parameters)
+    return result
+
+
+def series_task(generator, beta, length, configurations, skip, update='metropolis', equilibration=0):
+    # Energy and magnetisation of every configuration at a single beta, for the histograms of --reweight.
+    state = down_lattice(length, update)
+    for _ in range(equilibration):
+        updates[update](state, beta, skip, generator)
+    series = np.empty((2, configurations))
+    for i in range(configurations):
+        updates[update](state, beta, skip, generator)
+        series[:, i] = lattice_energy(state), total_magnetisation(state)
+    return series
+
+
+def reweighted_sweep(sim_betas, beta_values):
+    '''
+    Simulate only at 'sim_betas' and get <|m|> at every beta of 'beta_values' by multi-histogram reweighting of the
+    joint (E, M) histograms. Returns arrays with <|m|> and its jackknife error at every beta of 'beta_values' and at
+    the simulated ones.
+    '''
+    arguments = [(beta, length, configurations, skip, args.update, args.equilibration) for beta in sim_betas]
+    with telemetry.phase('simulation'):
+        if args.workers:
+            series = run_replicates(series_task, len(sim_betas), arguments, workers=args.workers)
+        else:
+            series = []
+            for i, task_arguments in enumerate(arguments):
+                series.append(series_task(rng, *task_arguments))
+                telemetry.progress('simulated betas', i + 1, len(arguments), unit='betas')
+    with telemetry.phase('reweighting'):
+        histograms = []
+        for energies, magnetisation_values in series:
+            histograms.append(JointHistogram(configurations))
+            histograms[-1].record(energies, magnetisation_values)
+        curves = reweight(histograms, sim_betas, np.concatenate([beta_values, sim_betas]), length ** 2)
+    curve = np.stack(curves['abs_magnetisation'], axis=-1)
+    return curve[:len(beta_values)], curve[len(beta_values):]
+
+
+def tempering_sweep(beta_values):
+    '''
+    All the betas at once with parallel tempering: the replicas are swept together as one array with --update
+    checkerboard (and no --workers), and one by one (or on --workers processes) otherwise. With --adapt the betas are
+    respaced during the equilibration to equalise the swap acceptance. Returns the final betas and, for every beta,
+    <|m|>, its error and its integrated autocorrelation time in sweeps.
+    '''
+    vectorized = args.update == 'checkerboard' and not args.workers
+    if vectorized:
+        states = -np.ones((len(beta_values), length, length), dtype=np.int8)
+    else:
+        states = [down_lattice(length, args.update) for _ in beta_values]
+    with telemetry.phase('tempering'):
+        outcome = parallel_tempering(updates[args.update], lattice_energy, magnetisation_per_spin, states, beta_values,
+                                     configurations, skip, args.equilibration, args.adapt, vectorized=vectorized,
+                                     workers=args.workers, generator=rng)
+    magnetisation = outcome['observable']
+    print('Swap acceptance between neighbouring betas:', np.round(outcome['acceptance'], 3))
+    if np.size(outcome['round_trips']):
+        print(f"{np.size(outcome['round_trips'])} round trips, mean time "
+              f"{np.mean(outcome['round_trips']) * outcome['work_per_round']:.1f} sweeps")
+    else:
+        print('No replica completed a round trip between the hottest and the coldest beta')
+    results = np.stack([magnetisation.stats.mean, magnetisation.binning.error,
+                        magnetisation.binning.tau_int * outcome['work_per_round']], axis=-1)
+    return outcome['betas'], results
+
+
+def beta_sweep(beta_values):
+    # <|m|>, its error and tau_int at every beta, one 'beta_task' after the other or on --workers processes.
+    arguments = [(beta, length, configurations, skip, args.checkpoints, args.anneal, args.equilibration,
+                  args.warm_equilibration, args.update, args.snapshots) for beta in beta_values]
+    results = np.empty((len(beta_values), 3))
+    if args.workers:
+        # Blocks of betas come back in order as they finish; the tasks in other processes are not instrumented.
+        for start, block in iter_replicates(beta_task, len(beta_values), arguments, workers=args.workers):
+            results[start:start + len(block)] = block
+            telemetry.progress('beta sweep', start + len(block), len(beta_values), unit='betas')
+    else:
+        telemetry.progress('beta sweep', 0, len(beta_values), unit='betas')
+        for i, task_arguments in enumerate(arguments):
+            results[i] = beta_task(rng, *task_arguments, telemetry=telemetry)
+            telemetry.progress('beta sweep', i + 1, len(beta_values), unit='betas', beta=task_arguments[0])
+    return results
+
+
+def cached(function, *arguments):
+    # 'function(*arguments)' through the --cache directory, keyed also by the flags that change the simulations. The
+    # arrays of a hit are memory-mapped, read only as they are used.
+    if not args.cache:
+        return function(*arguments)
+    flags = {name: value for name, value in vars(args).items()
+             if name not in ('save', 'cache', 'cache_size', 'telemetry', 'profile', 'trace_memory')}
+    return ResultCache(args.cache, args.cache_size * 2**20).call(function, *arguments, parameters=flags, generator=rng,
+                                                                 mmap_mode='r')
+
+
 def main():
     beta_values = [float(i)/20 for i in range(21)]
-    mean_magnetisation = []
-    for beta in beta_values:
-        print("beta =", beta)
-        state = -np.ones((length, length), dtype=int)
-        pos_energy_diff, acceptance_prob = get_acceptance_probabilities(beta)
-        magnetisation_values = [np.sum(state)/spins]
-        start = time.time()
-        for i in range(configurations):
-            mc_step(state, pos_energy_diff, acceptance_prob)
-            magnetisation_values.append(np.sum(state)/spins)
-            if i % (configurations//10) == 0:
-                print(i//(configurations//100))
-                end = time.time()
-                print(end-start)
-        mean_magnetisation.append(np.abs(np.mean(magnetisation_values)))
-    plt.plot(beta_values, mean_magnetisation, 'o')
+    if args.tempering:
+        beta_values, results = cached(tempering_sweep, beta_values)
+        with telemetry.phase('plotting'):
+            plot_sweep(beta_values, results)
+        return
+    if args.reweight:
+        fine_betas = np.linspace(beta_values[0], beta_values[-1], 201)
+        curve, points = cached(reweighted_sweep, args.reweight, fine_betas)
+        with telemetry.phase('plotting'):
+            plt.plot(fine_betas, curve[:, 0], color='g', label='Reweighted')
+            plt.fill_between(fine_betas, curve[:, 0] - curve[:, 1], curve[:, 0] + curve[:, 1], color='g', alpha=0.3)
+            plt.errorbar(args.reweight, points[:, 0], yerr=points[:, 1], fmt='o', color='b', label='Simulated betas')
+            plt.legend()
+            plt.show()
+        return
+    results = cached(beta_sweep, beta_values)
+    with telemetry.phase('plotting'):
+        plot_sweep(beta_values, results)
+
+
+def plot_sweep(beta_values, results):
+    print(f'{"beta":>6} {"<|m|>":>8} {"error":>8} {"tau_int (sweeps)":>17}')
+    for beta, (mean_magnetisation, error, tau) in zip(beta_values, results):
+        print(f'{beta:6.3f} {mean_magnetisation:8.4f} {error:8.4f} {tau:17.2f}')
+    plt.errorbar(beta_values, results[:, 0], yerr=results[:, 1], fmt='o')
     plt.show()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--save', default=False, action="store_true", help="Save plots generated instead of showing.")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Run the betas on this many processes, each with its own seed stream")
+    parser.add_argument('--checkpoints', type=str, default=None,
+                        help="Directory where the equilibrated states and results are saved, to skip the "
+                             "equilibration in later runs and resume interrupted ones")
+    parser.add_argument('--anneal', default=False, action="store_true",
+                        help="Start every beta from the saved state of the closest one (needs --checkpoints)")
+    parser.add_argument('--equilibration', type=int, default=0,
+                        help="Configurations discarded before measuring, starting from the all-down state")
+    parser.add_argument('--warm_equilibration', type=int, default=0,
+                        help="Configurations discarded before measuring, starting from an annealed state")
+    parser.add_argument('--update', type=str, default='metropolis', choices=list(updates),
+                        help="Random site Metropolis updates, heat-bath checkerboard sweeps of whole sublattices at "
+                             "once, Wolff or Swendsen-Wang cluster updates (much shorter autocorrelation times near "
+                             "beta_c), or heat-bath checkerboard sweeps of a bit packed lattice (64 spins per word, "
+                             "L a multiple of 64)")
+    parser.add_argument('--length', type=int, default=30, help="Linear size L of the L x L lattice")
+    parser.add_argument('--configurations', type=int, default=500, help="Number of measured configurations per beta")
+    parser.add_argument('--skip', type=int, default=10,
+                        help="Sweeps (L^2 trials each) between configurations, or clusters for --update wolff")
+    parser.add_argument('--tempering', default=False, action="store_true",
+                        help="Run all the betas at once with parallel tempering, proposing swaps of neighbouring betas "
+                             "every --skip steps")
+    parser.add_argument('--adapt', default=False, action="store_true",
+                        help="With --tempering, respace the betas during the --equilibration to equalise the swap "
+                             "acceptance")
+    parser.add_argument('--reweight', type=float, nargs='+', default=None, metavar='BETA',
+                        help="Simulate only at these betas and draw <|m|> on a fine grid by multi-histogram "
+                             "reweighting, with a jackknife error band")
+    parser.add_argument('--snapshots', type=str, default=None,
+                        help="Directory where every measured configuration of the beta sweep is stored, bit packed, "
+                             "for later analyses")
+    parser.add_argument('--cache', type=str, default=None,
+                        help="Directory where the results of the sweep are cached, so that the plot can be redrawn "
+                             "without simulating again")
+    parser.add_argument('--cache_size', type=float, default=1024, help="Size limit of the --cache directory in MiB")
+    add_arguments(parser)
     args = parser.parse_args()
-    length = 30
+    if args.reweight and (args.tempering or args.checkpoints):
+        parser.error('--reweight cannot be combined with --tempering or --checkpoints')
+    if args.tempering and (args.checkpoints or args.anneal):
+        parser.error('--tempering cannot be combined with --checkpoints or --anneal')
+    if args.anneal and not args.checkpoints:
+        parser.error('--anneal needs --checkpoints')
+    if args.snapshots and (args.tempering or args.reweight):
+        parser.error('--snapshots is only available for the plain beta sweep')
+    if args.update == 'packed' and args.length % 64:
+        parser.error('--update packed needs a --length that is a multiple of 64')
+    length = args.length
     spins = length ** 2
-    configurations = 500
-    skip = 10
-    main()
+    configurations = args.configurations
+    skip = args.skip
+    telemetry = Telemetry.from_args(args)
+    with telemetry:
+        main()
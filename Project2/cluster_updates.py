@@ -0,0 +1,105 @@
+import functools
+import numpy as np
+
+'''
+Cluster updates for the 2D Ising model on a periodic L x L lattice (J = 1).
+
+Bonds between parallel neighbours are activated with probability p = 1 - exp(-2 beta), and whole clusters of spins
+connected by active bonds are flipped at once. Near beta_c = ln(1 + sqrt(2))/2 = 0.4407 the clusters are as large as
+the correlated regions, so the autocorrelation time grows only weakly with L (dynamic exponent z of about 0.25 for
+Wolff, against about 2.17 for single spin Metropolis).
+    -Wolff (PRL 62, 1989): a single cluster grown from a random site is flipped.
+    -Swendsen and Wang (PRL 58, 1987): every bond of the lattice is tried, all the clusters are labelled and each one
+     is flipped with probability 1/2.
+Both take (state, beta, steps, generator) like the single spin updates of Project2.2, change a contiguous L x L array of
+spins in place and return the work done in sweeps. A Swendsen-Wang step is a sweep; a Wolff step is a single cluster.
+'''
+
+
+@functools.lru_cache(maxsize=None)
+def neighbour_table(length):
+    # Flat indices of the right, left, lower and upper neighbours of every site, shape (L^2, 4).
+    index = np.arange(length ** 2).reshape(length, length)
+    table = np.stack([np.roll(index, -1, axis=1), np.roll(index, 1, axis=1), np.roll(index, -1, axis=0),
+                      np.roll(index, 1, axis=0)], axis=-1).reshape(-1, 4)
+    table.flags.writeable = False  # Shared by every call with the same L.
+    return table
+
+
+def wolff_cluster(state, beta, generator):
+    '''
+    Grow and flip a single Wolff cluster. The cluster grows one shell at a time: every bond from the sites added in the
+    last shell to neighbours with the original spin is tried at once. Sites are flipped as they join the cluster, so
+    "not yet in the cluster" is just "still has the original spin". Returns the size of the cluster.
+    '''
+    spins = state.reshape(-1)  # A view: the flips go to 'state'.
+    neighbours = neighbour_table(np.shape(state)[0])
+    p_add = -np.expm1(-2. * beta)
+    seed = generator.integers(np.size(spins))
+    spin = spins[seed]
+    spins[seed] = -spin
+    frontier = np.array([seed])
+    size = 1
+    while np.size(frontier):
+        candidates = neighbours[frontier].ravel()
+        candidates = candidates[spins[candidates] == spin]
+        # A site next to several sites of the shell joins if any of its bonds is activated.
+        frontier = np.unique(candidates[generator.random(np.size(candidates)) < p_add])
+        spins[frontier] = -spin
+        size += np.size(frontier)
+    return size
+
+
+def wolff_update(state, beta, clusters=1, generator=None):
+    '''
+    Flip 'clusters' Wolff clusters. Returns the work done in sweeps (spins flipped / L^2), which converts times measured
+    in clusters to sweeps. The number of clusters is fixed in advance: stopping after a given number of flipped spins
+    would make the time of the measurement depend on the sizes of the clusters and bias the averages.
+    '''
+    if generator is None:
+        generator = np.random.default_rng()
+    flipped = 0
+    for _ in range(clusters):
+        flipped += wolff_cluster(state, beta, generator)
+    return flipped / np.size(state)
+
+
+def label_clusters(sites, bonds_from, bonds_to):
+    '''
+    Union-find over the whole lattice, vectorized: every pending bond hooks the root with the larger label under the
+    root with the smaller one, and pointer jumping (parent = parent[parent]) flattens the trees, until both ends of
+    every bond have the same root. Bonds already inside a cluster are dropped after every round. Returns the root (the
+    smallest site) of the cluster of every site.
+    '''
+    parent = np.arange(sites)
+    while True:
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+        roots_from, roots_to = parent[bonds_from], parent[bonds_to]
+        pending = roots_from != roots_to
+        if not np.any(pending):
+            return parent
+        bonds_from, bonds_to = bonds_from[pending], bonds_to[pending]
+        roots_from, roots_to = roots_from[pending], roots_to[pending]
+        np.minimum.at(parent, np.maximum(roots_from, roots_to), np.minimum(roots_from, roots_to))
+
+
+def swendsen_wang_sweeps(state, beta, sweeps=1, generator=None):
+    # 'sweeps' Swendsen-Wang updates, each of which visits every bond once. Returns the work done in sweeps.
+    if generator is None:
+        generator = np.random.default_rng()
+    spins = state.reshape(-1)  # A view: the flips go to 'state'.
+    sites = np.size(spins)
+    neighbours = neighbour_table(np.shape(state)[0])[:, [0, 2]]  # Right and lower neighbours: every bond once.
+    p_add = -np.expm1(-2. * beta)
+    bonds_from = np.repeat(np.arange(sites), 2)
+    bonds_to = neighbours.ravel()
+    for _ in range(sweeps):
+        active = (spins[bonds_from] == spins[bonds_to]) & (generator.random(2 * sites) < p_add)
+        roots = label_clusters(sites, bonds_from[active], bonds_to[active])
+        flip = generator.random(sites) < 0.5  # Only the entries of the roots are used.
+        spins[:] = np.where(flip[roots], -spins, spins)
+    return sweeps
@@ -0,0 +1,150 @@
+import numpy as np
+
+'''
+Multi-spin coding of the 2D Ising model (J = 1, periodic boundaries): 64 spins per uint64 word, bit = 1 for spin up.
+Bit k of word w of row i holds the spin in column 64 w + k, so L must be a multiple of 64 and the lattice takes L^2/8
+bytes instead of 8 L^2.
+
+A flip of spin s with k anti-aligned neighbours (out of 4) changes the energy by dE = 8 - 4k and is accepted with the
+heat-bath probability 1 / (1 + exp(beta dE)): p_0 = 1 / (1 + exp(8 beta)) for k = 0, p_1 = 1 / (1 + exp(4 beta)) for
+k = 1, 1/2 for k = 2, 1 - p_1 for k = 3 and 1 - p_0 for k = 4. (Metropolis would always flip the spins with k >= 2, so
+at beta = 0 every half sweep would flip a whole sublattice and the chain would not be ergodic.) Word by word:
+    -The anti-aligned neighbours are s XOR neighbour for the 4 shifted copies of the lattice, and k = 0, ..., 4 come
+     out of a bitwise adder of these 4 bits.
+    -Random words whose bits are 1 with probability p are built from the binary expansion of p (see 'bernoulli_words');
+     one word for p_0 and one for p_1 serve k = 0, 4 and k = 1, 3 (complemented for 1 - p), and a raw random word k = 2.
+     Every bit is used for a single k, so the bits of different sites stay independent.
+    -The sites of one colour of the checkerboard do not interact, so half the bits of every word are updated at once.
+Magnetisation and energy come from bit counts: M = 2 (spins up) - L^2 and E = 2 (anti-aligned bonds) - 2 L^2.
+'''
+
+WORD = 64
+ALL_ONES = np.uint64(2 ** WORD - 1)
+# Bits of the even and odd columns of a word (64 is even, so the pattern is the same in every word).
+EVEN_COLUMNS = np.uint64(int('01' * (WORD // 2), 2))
+ODD_COLUMNS = ~EVEN_COLUMNS
+BYTE_COUNTS = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+def popcount(words):
+    # Number of set bits of every word. np.bitwise_count needs NumPy 2.0; older versions count byte by byte.
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    return np.sum(BYTE_COUNTS[np.ascontiguousarray(words).view(np.uint8)].reshape(np.shape(words) + (8,)), axis=-1)
+
+
+def bernoulli_words(probability, shape, generator, precision=53):
+    '''
+    Random words of independent bits that are 1 with the given probability. For every bit a uniform number U is
+    compared with p digit by digit, from the most significant binary digit down, with one random word per digit: a bit
+    is decided as soon as its digit of U differs from the one of p. Only the words with undecided bits draw more digits,
+    so about 8 random words per word are needed whatever p is (instead of one uniform number per bit). Bits still
+    undecided after 'precision' digits are 0, a bias of at most 2^-precision.
+    '''
+    size = int(np.prod(shape))
+    if probability >= 1.:
+        return np.full(shape, ALL_ONES)
+    result = np.zeros(size, dtype=np.uint64)
+    if probability <= 0.:
+        return result.reshape(shape)
+    index = np.arange(size)
+    undecided = np.full(size, ALL_ONES)
+    fraction = float(probability)
+    for _ in range(precision):
+        fraction *= 2.
+        digit = fraction >= 1.
+        fraction -= digit
+        uniform_digits = generator.bit_generator.random_raw(np.size(index))
+        if digit:  # U < p for the bits with digit 0; the bits with digit 1 are still tied.
+            result[index] |= undecided & ~uniform_digits
+            undecided &= uniform_digits
+        else:  # U > p for the bits with digit 1; the bits with digit 0 are still tied.
+            undecided &= ~uniform_digits
+        pending = undecided != 0
+        index = index[pending]
+        undecided = undecided[pending]
+        if not np.size(index):
+            break
+    return result.reshape(shape)
+
+
+class PackedLattice:
+    def __init__(self, words):
+        self.words = words  # uint64 array of shape (L, L / 64).
+
+    @classmethod
+    def filled(cls, length, spin=-1):
+        if length % WORD:
+            raise ValueError(f'The linear size of a packed lattice must be a multiple of {WORD}, not {length}')
+        return cls(np.full((length, length // WORD), ALL_ONES if spin > 0 else np.uint64(0)))
+
+    @classmethod
+    def from_spins(cls, state):
+        # From an L x L array of spins +1/-1.
+        if np.shape(state)[1] % WORD:
+            raise ValueError(f'The linear size of a packed lattice must be a multiple of {WORD}, '
+                             f'not {np.shape(state)[1]}')
+        bytes_ = np.packbits(np.asarray(state) > 0, axis=1, bitorder='little')
+        return cls(np.ascontiguousarray(bytes_).view('<u8').astype(np.uint64))
+
+    def to_spins(self):
+        # L x L int8 array of spins +1/-1, e.g. for plotting.
+        bits = np.unpackbits(self.words.astype('<u8').view(np.uint8), axis=1, bitorder='little')
+        return (2 * bits.astype(np.int8) - 1).astype(np.int8)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.to_spins() if dtype is None else self.to_spins().astype(dtype)
+
+    @property
+    def length(self):
+        return np.shape(self.words)[0]
+
+    def neighbours(self):
+        # Lattices of the right, left, lower and upper neighbours of every spin.
+        words = self.words
+        right = (words >> np.uint64(1)) | (np.roll(words, -1, axis=1) << np.uint64(WORD - 1))
+        left = (words << np.uint64(1)) | (np.roll(words, 1, axis=1) >> np.uint64(WORD - 1))
+        return right, left, np.roll(words, -1, axis=0), np.roll(words, 1, axis=0)
+
+    def magnetisation(self):
+        return 2 * int(np.sum(popcount(self.words), dtype=np.int64)) - self.length ** 2
+
+    def energy(self):
+        right, _, lower, _ = self.neighbours()
+        anti_aligned = np.sum(popcount(self.words ^ right), dtype=np.int64) + np.sum(popcount(self.words ^ lower),
+                                                                                      dtype=np.int64)
+        return 2 * int(anti_aligned) - 2 * self.length ** 2
+
+    def colour_masks(self):
+        # Bits of the two colours of the checkerboard for every row, shape (L, 1) each.
+        even_rows = (np.arange(self.length) % 2 == 0)[:, np.newaxis]
+        colour = np.where(even_rows, EVEN_COLUMNS, ODD_COLUMNS)
+        return colour, ~colour
+
+    def sweep(self, beta, sweeps=1, generator=None):
+        # 'sweeps' checkerboard heat-bath sweeps. Returns the work done in sweeps.
+        if generator is None:
+            generator = np.random.default_rng()
+        shape = np.shape(self.words)
+        probability_0 = 0.5 * (1. - np.tanh(4. * beta))  # 1 / (1 + exp(8 beta))
+        probability_1 = 0.5 * (1. - np.tanh(2. * beta))  # 1 / (1 + exp(4 beta))
+        for _ in range(sweeps):
+            # The two colours use different bits of the random words, so one set of words serves the whole sweep.
+            random_0 = bernoulli_words(probability_0, shape, generator)
+            random_1 = bernoulli_words(probability_1, shape, generator)
+            random_half = generator.bit_generator.random_raw(np.prod(shape)).reshape(shape)
+            for colour in self.colour_masks():
+                a, b, c, d = (self.words ^ neighbour for neighbour in self.neighbours())
+                pairs = (a & b) | (c & d)  # Both neighbours of a pair anti-aligned: k >= 2.
+                odd = a ^ b ^ c ^ d
+                none = ~(a | b | c | d)
+                four = a & b & c & d
+                two = ~(odd | none | four)
+                self.words ^= colour & ((none & random_0) | (odd & ~pairs & random_1) | (two & random_half)
+                                        | (odd & pairs & ~random_1) | (four & ~random_0))
+        return sweeps
+
+
+def packed_sweeps(lattice, beta, sweeps=1, generator=None):
+    # 'PackedLattice.sweep' with the interface of the updates of Project2.2.
+    return lattice.sweep(beta, sweeps, generator)
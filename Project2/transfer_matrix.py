@@ -0,0 +1,107 @@
+import functools
+import numpy as np
+
+'''
+Exact results for a ring of N Ising spins, E = -J sum_i s_i s_{i+1} - h sum_i s_i (periodic boundary conditions), from
+the 2x2 transfer matrix T_ab = exp(-beta * e_ab) with bond energy e_ab = -J a b - h (a + b) / 2, so that Z = Tr T^N.
+
+Moments of E and M follow from derivatives of Z: with A = e o T (elementwise product) the first moment is
+<E> = N Tr(A T^{N-1}) / Z and the second one is
+<E^2> = [N Tr((e^2 o T) T^{N-1}) + N sum_{r=0}^{N-2} Tr(A T^r A T^{N-2-r})] / Z,
+and the same for M with the site magnetisation m_ab = (a + b) / 2 in place of e_ab. All the traces are evaluated in
+the eigenbasis of T, with the eigenvalues divided by the largest one to avoid overflows, so the cost does not depend
+on N. Everything is vectorized over grids of kT and h, and the results for a given grid are memoized.
+Energies and temperatures are in units of J (k_B = 1).
+'''
+
+SPINS = np.array([1., -1.])
+
+
+def transfer_matrices(thermal_energies, h, coupling=1.):
+    '''
+    Arrays of shape (..., 2, 2) with the transfer matrix, the bond energy and the bond magnetisation, and the lowest
+    bond energy e_min of shape (...). The matrix is exp(-beta * (e_ab - e_min)), which does not overflow at low
+    temperatures; the factor exp(-beta * N * e_min) of Z cancels in every average.
+    '''
+    a, b = SPINS[:, np.newaxis], SPINS[np.newaxis, :]
+    beta = 1. / np.asarray(thermal_energies, dtype=float)[..., np.newaxis, np.newaxis]
+    h = np.asarray(h, dtype=float)[..., np.newaxis, np.newaxis]
+    bond_magnetisation = (a + b) / 2. + 0. * h
+    bond_energy = -coupling * a * b - h * bond_magnetisation
+    lowest = np.min(bond_energy, axis=(-2, -1), keepdims=True)
+    return np.exp(-beta * (bond_energy - lowest)), bond_energy, bond_magnetisation, lowest[..., 0, 0]
+
+
+def _eigenbasis(matrices, eigenvectors):
+    return np.swapaxes(eigenvectors, -1, -2) @ matrices @ eigenvectors
+
+
+def _moments(spins, ratios, eigenvectors, operator, operator_sqr, partition):
+    # First and second moments of the sum over the N bonds of the quantity whose insertion matrices are given.
+    first = spins * np.einsum('...ii,...i->...', _eigenbasis(operator, eigenvectors), ratios ** (spins - 1))
+    first_sqr = spins * np.einsum('...ii,...i->...', _eigenbasis(operator_sqr, eigenvectors), ratios ** (spins - 1))
+    # pair_sums[i, j] = sum_{r=0}^{N-2} ratio_j^r ratio_i^{N-2-r}
+    ratio_i, ratio_j = ratios[..., :, np.newaxis], ratios[..., np.newaxis, :]
+    difference = ratio_i - ratio_j
+    degenerate = np.abs(difference) < 1e-12
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pair_sums = np.where(degenerate, (spins - 1) * ratio_i ** (spins - 2),
+                             (ratio_i ** (spins - 1) - ratio_j ** (spins - 1)) / np.where(degenerate, 1., difference))
+    rotated = _eigenbasis(operator, eigenvectors)
+    pairs = spins * np.einsum('...ij,...ji,...ij->...', rotated, rotated, pair_sums)
+    return first / partition, (first_sqr + pairs) / partition
+
+
+@functools.lru_cache(maxsize=None)
+def _exact_observables(spins, thermal_energies, fields, shape, coupling):
+    thermal_energies = np.reshape(thermal_energies, shape)
+    fields = np.reshape(fields, shape)
+    matrices, bond_energy, bond_magnetisation, lowest_energy = transfer_matrices(thermal_energies, fields, coupling)
+    eigenvalues, eigenvectors = np.linalg.eigh(matrices)  # Ascending: the largest eigenvalue is the last one.
+    largest = eigenvalues[..., -1:]
+    ratios = eigenvalues / largest
+    scaled = matrices / largest[..., np.newaxis]
+    partition = np.sum(ratios ** spins, axis=-1)  # Z / lambda_max^N
+    energy, energy_sqr = _moments(spins, ratios, eigenvectors, bond_energy * scaled, bond_energy ** 2 * scaled,
+                                  partition)
+    magnetisation, magnetisation_sqr = _moments(spins, ratios, eigenvectors, bond_magnetisation * scaled,
+                                                bond_magnetisation ** 2 * scaled, partition)
+    observables = {
+        'free_energy': lowest_energy - thermal_energies * (np.log(largest[..., 0]) + np.log(partition) / spins),
+        'energy': energy / spins,
+        'specific_heat': (energy_sqr - energy ** 2) / (thermal_energies ** 2 * spins),
+        'magnetisation': magnetisation / spins,
+        'susceptibility': (magnetisation_sqr - magnetisation ** 2) / (thermal_energies * spins),
+    }
+    for name in observables:
+        observables[name] = np.array(observables[name])
+        observables[name].flags.writeable = False  # They are shared by every call with the same arguments.
+    return observables
+
+
+def exact_observables(spins, thermal_energies, h=0., coupling=1.):
+    '''
+    Exact free energy, energy, specific heat c_V/k_B, magnetisation and susceptibility, all per spin, of a ring of
+    'spins' spins (at least 2) for every kT and h (broadcast against each other). Returns a dictionary of arrays.
+    '''
+    thermal_energies, h = np.broadcast_arrays(np.asarray(thermal_energies, dtype=float), np.asarray(h, dtype=float))
+    return _exact_observables(int(spins), tuple(thermal_energies.ravel()), tuple(h.ravel()), np.shape(h),
+                              float(coupling))
+
+
+def spin_correlation(spins, thermal_energy, h=0., distances=None, coupling=1., connected=False):
+    '''
+    Exact <s_0 s_r> = Tr(S T^r S T^{N-r}) / Z, with S = diag(1, -1), for every distance r (by default 0, ..., N/2) at a
+    single kT and h. With 'connected' the product of the magnetisations per spin is subtracted.
+    '''
+    distances = np.arange(spins // 2 + 1) if distances is None else np.asarray(distances)
+    matrices, _, _, _ = transfer_matrices(thermal_energy, h, coupling)
+    eigenvalues, eigenvectors = np.linalg.eigh(matrices)
+    ratios = eigenvalues / eigenvalues[-1]
+    rotated = _eigenbasis(np.diag(SPINS), eigenvectors)
+    powers_r = ratios[np.newaxis, :] ** distances[:, np.newaxis]
+    powers_rest = ratios[np.newaxis, :] ** (spins - distances[:, np.newaxis])
+    correlation = np.einsum('ij,ji,rj,ri->r', rotated, rotated, powers_r, powers_rest) / np.sum(ratios ** spins)
+    if connected:
+        correlation = correlation - exact_observables(spins, thermal_energy, h, coupling)['magnetisation'] ** 2
+    return correlation
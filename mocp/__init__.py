@@ -0,0 +1,4 @@
+'''
+Tools shared by the projects of the Methods of Computational Physics (MoCP22) course. The project scripts add the root
+of the repository to 'sys.path' to import them.
+'''
@@ -0,0 +1,154 @@
+import numpy as np
+
+'''
+Online accumulators: statistics of a stream of values are updated chunk by chunk, so memory does not grow with the
+length of the stream. Every accumulator handles values of an arbitrary shape (e.g. one value per replica): a chunk of
+n observations is an array of shape (n, *shape).
+'''
+
+
+def kahan_add(total, compensation, value):
+    # Compensated (Kahan) summation: 'compensation' carries the low-order bits lost in the previous additions.
+    corrected = value - compensation
+    new_total = total + corrected
+    return new_total, (new_total - total) - corrected
+
+
+class RunningStats:
+    '''
+    Mean, variance and third and fourth central moments of a stream of values of a given shape, merged chunk by chunk
+    with Welford's update (in the pairwise form of Chan et al.). The increments of the mean and of the sum of squared
+    deviations are added with Kahan summation, so the accumulated round-off does not grow with the number of chunks.
+    '''
+    def __init__(self, shape=()):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)  # Sums of powers of the deviations from the mean.
+        self.m3 = np.zeros(shape)
+        self.m4 = np.zeros(shape)
+        self._mean_compensation = np.zeros(shape)
+        self._m2_compensation = np.zeros(shape)
+
+    def update(self, values):
+        # 'values' has shape (n, *shape): n new observations.
+        values = np.asarray(values, dtype=float)
+        n = np.shape(values)[0]
+        if n == 0:
+            return
+        chunk_mean = np.mean(values, axis=0)
+        deviations = values - chunk_mean
+        chunk_m2 = np.sum(deviations ** 2, axis=0)
+        chunk_m3 = np.sum(deviations ** 3, axis=0)
+        chunk_m4 = np.sum(deviations ** 4, axis=0)
+        count = self.count
+        total = count + n
+        delta = chunk_mean - self.mean
+        self.m4 = (self.m4 + chunk_m4 + delta ** 4 * count * n * (count ** 2 - count * n + n ** 2) / total ** 3
+                   + 6. * delta ** 2 * (count ** 2 * chunk_m2 + n ** 2 * self.m2) / total ** 2
+                   + 4. * delta * (count * chunk_m3 - n * self.m3) / total)
+        self.m3 = (self.m3 + chunk_m3 + delta ** 3 * count * n * (count - n) / total ** 2
+                   + 3. * delta * (count * chunk_m2 - n * self.m2) / total)
+        self.mean, self._mean_compensation = kahan_add(self.mean, self._mean_compensation, delta * n / total)
+        self.m2, self._m2_compensation = kahan_add(self.m2, self._m2_compensation,
+                                                   chunk_m2 + delta ** 2 * count * n / total)
+        self.count = total
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else np.full(np.shape(self.mean), np.nan)
+
+    @property
+    def std_error(self):
+        # Assumes independent observations.
+        return np.sqrt(self.variance / self.count)
+
+    @property
+    def skewness(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt(self.count) * self.m3 / self.m2 ** 1.5
+
+    @property
+    def kurtosis(self):
+        # Excess kurtosis.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.count * self.m4 / self.m2 ** 2 - 3.
+
+
+class BinningAnalysis:
+    '''
+    Online blocking (binning) analysis of a correlated time series (Flyvbjerg and Petersen). Level l holds the running
+    statistics of the means of consecutive blocks of 2^l observations; the standard error computed from the blocks
+    grows with l until the blocks are longer than the correlation time, and then stays on a plateau at the true error.
+    Only one incomplete block per level is kept, so memory grows as log2 of the length of the series.
+    '''
+    def __init__(self, shape=(), min_blocks=32):
+        self.shape = shape
+        self.min_blocks = min_blocks
+        self.levels = []  # RunningStats of the block means of every level.
+        self._pending = []  # Observation waiting for its partner to form a block of the next level (or None).
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        level = 0
+        while np.shape(values)[0] > 0:
+            if level == len(self.levels):
+                self.levels.append(RunningStats(self.shape))
+                self._pending.append(None)
+            self.levels[level].update(values)
+            if self._pending[level] is not None:
+                values = np.concatenate((self._pending[level][np.newaxis], values))
+            pairs = np.shape(values)[0] // 2
+            self._pending[level] = values[-1] if np.shape(values)[0] % 2 else None
+            values = (values[0:2 * pairs:2] + values[1:2 * pairs:2]) / 2.
+            level += 1
+
+    def errors(self):
+        # Standard error of the mean estimated at every level with at least 'min_blocks' blocks.
+        return np.array([level.std_error for level in self.levels if level.count >= self.min_blocks])
+
+    @property
+    def error(self):
+        # Error at the last level with enough blocks: the largest (and least biased) estimate available.
+        errors = self.errors()
+        return errors[-1] if len(errors) else np.full(self.shape, np.nan)
+
+    @property
+    def tau_int(self):
+        # Integrated autocorrelation time (in units of the spacing of the series): error^2 = (2 tau) sigma^2 / n.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 0.5 * (self.error / self.levels[0].std_error) ** 2 if self.levels else np.full(self.shape, np.nan)
+
+
+class Observable:
+    '''
+    Streaming measurements of a quantity of a Markov chain. 'record' takes consecutive values of the chain (one per
+    step) and keeps one every 'interval' steps; these measurements update the running moments and the binning
+    analysis. With 'keep_series' the measurements themselves are also kept (a time series decimated by 'interval').
+    '''
+    def __init__(self, interval=1, shape=(), keep_series=False, min_blocks=32):
+        self.interval = interval
+        self.stats = RunningStats(shape)
+        self.binning = BinningAnalysis(shape, min_blocks)
+        self.keep_series = keep_series
+        self._series = []
+        self._steps = 0
+
+    def record(self, values):
+        values = np.asarray(values, dtype=float)
+        measured = values[(-self._steps) % self.interval::self.interval]
+        self._steps += np.shape(values)[0]
+        self.stats.update(measured)
+        self.binning.update(measured)
+        if self.keep_series:
+            self._series.append(measured)
+
+    @property
+    def series(self):
+        return np.concatenate(self._series) if self._series else np.empty((0,) + np.shape(self.stats.mean))
+
+    def summary(self):
+        # Compact summary. 'error' accounts for the autocorrelation, 'naive_error' assumes independent measurements;
+        # 'tau_int' is in units of measurements (multiply by 'interval' for chain steps).
+        return {'mean': self.stats.mean, 'variance': self.stats.variance, 'skewness': self.stats.skewness,
+                'kurtosis': self.stats.kurtosis, 'naive_error': self.stats.std_error, 'error': self.binning.error,
+                'tau_int': self.binning.tau_int, 'measurements': self.stats.count}
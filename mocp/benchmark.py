@@ -0,0 +1,259 @@
+import argparse
+import functools
+import importlib.util
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+os.environ.setdefault('MPLBACKEND', 'Agg')  # The project scripts import pyplot; nothing is plotted here.
+
+'''
+Benchmarks of the Monte-Carlo kernels of the projects, without plots:
+    python -m mocp.benchmark run [--quick] [--output results.json]
+    python -m mocp.benchmark compare baseline.json results.json [--tolerance 0.2]
+
+Every kernel runs at several problem sizes. A run starts from a generator seeded with '--seed' (the kernels that use
+the module level 'rng' of their script get it replaced), so every repetition does exactly the same work. The kernel is
+run once to warm up (imports, Numba compilation, caches), the time is the best of '--repeats' runs and the peak memory
+comes from one more run under 'tracemalloc' (which slows it down, so it is not timed). Throughput is the work done
+(samples, steps, flips or sweeps, see 'unit') per second.
+
+'compare' matches the entries of two result files by (kernel, size) and exits with status 1 if the throughput of any
+of them fell below (1 - tolerance) times the baseline, or its peak memory grew above (1 + tolerance) times the
+baseline. Timings are only comparable on the same machine.
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+benchmarks = {}
+scripts = {}
+
+
+def benchmark(unit, sizes, quick_sizes):
+    '''
+    Register 'function(size, generator)' as the benchmark of a kernel. It runs the kernel once at the given problem size
+    and returns the work done, in 'unit'.
+    '''
+    def register(function):
+        benchmarks[function.__name__] = {'function': function, 'unit': unit, 'sizes': sizes, 'quick_sizes': quick_sizes}
+        return function
+    return register
+
+
+def script(path):
+    # Import a project script (e.g. 'Project2/Project2.2.py') as a module, once. Its directory goes to 'sys.path' so
+    # that its sibling modules are found, as when it runs on its own.
+    if path not in scripts:
+        directory = os.path.join(ROOT, os.path.dirname(path))
+        if directory not in sys.path:
+            sys.path.insert(0, directory)
+        name = os.path.splitext(os.path.basename(path))[0].replace('.', '_')
+        spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        scripts[path] = module
+    return scripts[path]
+
+
+@benchmark('samples', sizes=[10 ** 3, 10 ** 5, 10 ** 6], quick_sizes=[10 ** 3, 10 ** 5])
+def mc_integrator(size, generator):
+    module = script('Project1/Project1.1.py')
+    module.rng = generator
+    module.args = argparse.Namespace(a=0., b=1., N=size, sampler='random')
+    module.mc_integrator(lambda _: 1.)
+    return size
+
+
+@benchmark('samples', sizes=[10 ** 3, 10 ** 4, 10 ** 5], quick_sizes=[10 ** 3, 10 ** 4])
+def importance_sampling_1(size, generator):
+    # 4 sampling densities, 10 replicates of 'size' samples each.
+    module = script('Project1/Project1.1.py')
+    module.rng = generator
+    module.args = argparse.Namespace(N=size, M=10)
+    module.importance_sampling_1()
+    return 4 * 10 * size
+
+
+@benchmark('samples', sizes=[10 ** 3, 10 ** 5, 10 ** 6], quick_sizes=[10 ** 3, 10 ** 5])
+def importance_sampling_2(size, generator):
+    # The convergence curves of 'importance_sampling_2' up to N = size, without the plot.
+    module = script('Project1/Project1.1.py')
+    module.rng = generator
+    n_values = np.unique(np.geomspace(10, size, num=100).astype(int))
+    module.convergence_curves([1, 2, 3, 4], n_values, replicates=10)
+    return 4 * 10 * size
+
+
+@benchmark('steps', sizes=[10 ** 3, 10 ** 5, 10 ** 6], quick_sizes=[10 ** 3, 10 ** 5])
+def random_walk(size, generator):
+    script('Project1/Project1.2.py').random_walk(size, generator=generator)
+    return size
+
+
+@benchmark('steps', sizes=[10 ** 3, 10 ** 4, 10 ** 5], quick_sizes=[10 ** 3, 10 ** 4])
+def discrete_decay(size, generator):
+    # One step per nucleus left at every time step (decay rate 0.3).
+    module = script('Project1/Project1.4.py')
+    module.rng = generator
+    return int(np.sum(module.discrete_decay(size, 0.3)[:-1]))
+
+
+@benchmark('steps', sizes=[10 ** 3, 10 ** 6], quick_sizes=[10 ** 3])
+def binomial_decay(size, generator):
+    # Same steps as 'discrete_decay', 1000 chains at once.
+    chains = script('Project1/Project1.4.py').binomial_decay(size, 0.3, chains=1000, generator=generator)
+    return int(np.sum(chains[:-1]))
+
+
+@benchmark('flips', sizes=[10 ** 3, 10 ** 4, 10 ** 5], quick_sizes=[10 ** 3, 10 ** 4])
+def trial_spin_flips(size, generator):
+    # 'size' trial flips on a chain of 100 spins at kT = 1.
+    script('Project2/Project2.1.py').trial_spin_flips([-1] * 100, 1., size, generator=generator)
+    return size
+
+
+@benchmark('flips', sizes=[10 ** 3, 10 ** 5, 10 ** 6], quick_sizes=[10 ** 3, 10 ** 5])
+def trial_spin_flips_fast(size, generator):
+    script('Project2/Project2.1.py').trial_spin_flips_fast(np.full(100, -1), 1., size, generator=generator)
+    return size
+
+
+@benchmark('sweeps', sizes=[10, 30, 60], quick_sizes=[10, 30])
+def mc_step(size, generator):
+    # One sweep (L^2 trial flips) of an L x L lattice at beta = 0.44, with L = size.
+    module = script('Project2/Project2.2.py')
+    state = np.full((size, size), -1)
+    module.mc_step(state, *module.get_acceptance_probabilities(0.44), skip=1, generator=generator)
+    return 1
+
+
+@benchmark('sweeps', sizes=[64, 256, 1024], quick_sizes=[64, 256])
+def checkerboard_sweeps(size, generator):
+    module = script('Project2/Project2.2.py')
+    states = module.down_lattice(size, 'checkerboard')
+    return module.checkerboard_sweeps(states, 0.44, sweeps=10, generator=generator)
+
+
+@benchmark('sweeps', sizes=[64, 1024, 4096], quick_sizes=[64, 1024])
+def packed_sweeps(size, generator):
+    module = script('Project2/Project2.2.py')
+    return module.packed_sweeps(module.PackedLattice.filled(size), 0.44, sweeps=10, generator=generator)
+
+
+@benchmark('sweeps', sizes=[32, 128, 512], quick_sizes=[32, 128])
+def swendsen_wang_sweeps(size, generator):
+    module = script('Project2/Project2.2.py')
+    return module.swendsen_wang_sweeps(np.full((size, size), -1, dtype=np.int8), 0.44, sweeps=10, generator=generator)
+
+
+@functools.lru_cache(maxsize=None)
+def critical_state(size):
+    # L x L state equilibrated at beta_c with Swendsen-Wang, built once per size (a cold start grows a single cluster).
+    state = np.full((size, size), -1, dtype=np.int8)
+    script('Project2/Project2.2.py').swendsen_wang_sweeps(state, 0.44, sweeps=20, generator=np.random.default_rng(0))
+    return state
+
+
+@benchmark('sweeps', sizes=[32, 128, 512], quick_sizes=[32, 128])
+def wolff_update(size, generator):
+    # 100 clusters at beta_c.
+    return script('Project2/Project2.2.py').wolff_update(critical_state(size).copy(), 0.44, clusters=100,
+                                                         generator=generator)
+
+
+def measure(function, size, seed, repeats):
+    # Work, best time in seconds and peak traced memory in bytes of 'function(size, generator)'.
+    function(size, np.random.default_rng(seed))
+    seconds = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        work = function(size, np.random.default_rng(seed))
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function(size, np.random.default_rng(seed))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return work, seconds, peak
+
+
+def run(names=None, quick=False, seed=42, repeats=3, verbose=True):
+    names = list(benchmarks) if names is None else names
+    results = []
+    for name in names:
+        entry = benchmarks[name]
+        for size in entry['quick_sizes' if quick else 'sizes']:
+            work, seconds, peak = measure(entry['function'], size, seed, repeats)
+            results.append({'kernel': name, 'size': size, 'unit': entry['unit'], 'work': work, 'seconds': seconds,
+                            'throughput': work / seconds, 'peak_bytes': peak})
+            if verbose:
+                print(f'{name:>22} {size:>8} {work / seconds:12.4e} {entry["unit"]}/s {peak / 2 ** 20:10.2f} MiB',
+                      flush=True)
+    return {'meta': {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+                     'machine': platform.machine(), 'cpus': os.cpu_count(), 'seed': seed, 'repeats': repeats,
+                     'quick': quick, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z')},
+            'results': results}
+
+
+def compare(baseline, current, tolerance=0.2):
+    # Print the changes of every entry in both files and return the list of regressions.
+    reference = {(entry['kernel'], entry['size']): entry for entry in baseline['results']}
+    regressions = []
+    print(f'{"kernel":>22} {"size":>8} {"throughput":>11} {"memory":>11}')
+    for entry in current['results']:
+        old = reference.get((entry['kernel'], entry['size']))
+        if old is None:
+            continue
+        speed = entry['throughput'] / old['throughput']
+        memory = entry['peak_bytes'] / max(old['peak_bytes'], 1)
+        slower = speed < 1. - tolerance
+        larger = memory > 1. + tolerance
+        flag = ' <- slower' * slower + ' <- more memory' * larger
+        print(f'{entry["kernel"]:>22} {entry["size"]:>8} {speed:10.2f}x {memory:10.2f}x{flag}')
+        if slower or larger:
+            regressions.append(entry)
+    return regressions
+
+
+def main():
+    if args.command == 'run':
+        names = args.kernels.split(',') if args.kernels else None
+        results = run(names, quick=args.quick, seed=args.seed, repeats=args.repeats)
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(results, file, indent=1)
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    regressions = compare(baseline, current, args.tolerance)
+    if regressions:
+        print(f'{len(regressions)} regression(s) beyond a tolerance of {args.tolerance:.0%}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the Monte-Carlo kernels.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="Run the benchmarks")
+    run_parser.add_argument('--output', type=str, default=None, help="JSON file for the results")
+    run_parser.add_argument('--quick', default=False, action="store_true", help="Only the smaller problem sizes")
+    run_parser.add_argument('--kernels', type=str, default='',
+                            help=f"Comma separated kernels to run (default: all). Available: {', '.join(benchmarks)}")
+    run_parser.add_argument('--seed', type=int, default=42, help="Seed of the generator of every run")
+    run_parser.add_argument('--repeats', type=int, default=3, help="Timed runs per size; the best one is kept")
+    compare_parser = commands.add_parser('compare', help="Compare results with a baseline")
+    compare_parser.add_argument('baseline', type=str, help="JSON file with the baseline results")
+    compare_parser.add_argument('current', type=str, help="JSON file with the new results")
+    compare_parser.add_argument('--tolerance', type=float, default=0.2,
+                                help="Relative loss of throughput or growth of memory allowed")
+    args = parser.parse_args()
+    if args.command == 'run' and args.kernels and not set(args.kernels.split(',')) <= set(benchmarks):
+        parser.error(f"Unknown kernels: {', '.join(sorted(set(args.kernels.split(',')) - set(benchmarks)))}")
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import hashlib
+import inspect
+import json
+import marshal
+import os
+import shutil
+import numpy as np
+
+'''
+Content-addressed cache of simulation results, so that plots can be redrawn without running the simulations again.
+
+An entry is keyed by the SHA-256 hash of:
+    -the qualified name of the function and its arguments, plus any other 'parameters' it depends on (e.g. the
+     command line flags it reads);
+    -the state of the generator it draws from when it is called (its seed, in effect);
+    -the code version: the source of the function and of every function of its module it uses (directly, through
+     another function, or through a dictionary of functions such as 'kernels'), the whole source of the modules of
+     this repository it uses (e.g. 'mocp.accumulators'), and the NumPy version, which fixes the random streams.
+Editing the plotting code of a script leaves the key unchanged; editing anything the simulation runs does not.
+
+The result of the function (an array, or tuples, lists and dictionaries of arrays) is stored either as a compressed
+.npz file, read whole on a hit, or, with an 'mmap_mode' (as in np.load), as a directory of .npy files that are
+memory-mapped on a hit, so large arrays are only read as they are used. The state of the generator after the call is
+stored too and restored on a hit, so the following computations draw the same numbers as in an uncached run. Entries
+are written to a temporary name and renamed.
+
+The total size of the entries is kept below 'max_bytes' by removing the least recently used ones (a hit updates the
+modification time of the entry); the entry just written is always kept.
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _jsonable(value):
+    # Conversion of NumPy values for json.dumps.
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not allowed in the key of a cached result')
+
+
+def _in_repository(path):
+    return path is not None and os.path.abspath(path).startswith(ROOT + os.sep)
+
+
+def _code_names(code):
+    # Global names used by a code object and by the code objects nested in it (comprehensions, lambdas, ...).
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if inspect.iscode(constant):
+            names |= _code_names(constant)
+    return names
+
+
+def code_version(function):
+    '''
+    Hash of the code run by 'function': its source and, recursively, the source of the functions of its module it
+    refers to, and the source files of the modules of the repository it refers to (as modules or through the
+    functions and classes imported from them).
+    '''
+    digest = hashlib.sha256(np.__version__.encode())
+    functions = [function]
+    seen = {function}
+    files = set()
+    while functions:
+        current = functions.pop()
+        try:
+            digest.update(inspect.getsource(current).encode())
+        except OSError:  # Defined interactively: the bytecode stands in for the source.
+            digest.update(marshal.dumps(current.__code__))
+        for name in sorted(_code_names(current.__code__)):
+            value = current.__globals__.get(name)
+            candidates = list(value.values()) if isinstance(value, dict) else [value]
+            for candidate in candidates:
+                if callable(candidate):  # Numba dispatchers keep the function in 'py_func', lru_cache in '__wrapped__'.
+                    candidate = inspect.unwrap(getattr(candidate, 'py_func', candidate))
+                if inspect.ismodule(candidate):
+                    path = getattr(candidate, '__file__', None)
+                elif inspect.isfunction(candidate) and candidate.__module__ == current.__module__:
+                    if candidate not in seen:
+                        seen.add(candidate)
+                        functions.append(candidate)
+                    continue
+                elif inspect.isfunction(candidate) or inspect.isclass(candidate):
+                    path = getattr(inspect.getmodule(candidate), '__file__', None)
+                else:
+                    continue
+                if _in_repository(path):
+                    files.add(os.path.abspath(path))
+    for path in sorted(files):
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def _flatten(value, arrays, name='result'):
+    # Store the arrays of a nested result in 'arrays' under path-like names; returns the layout of the result.
+    if isinstance(value, dict):
+        return {'dict': {key: _flatten(item, arrays, f'{name}.{key}') for key, item in value.items()}}
+    if isinstance(value, (tuple, list)):
+        return {type(value).__name__: [_flatten(item, arrays, f'{name}.{i}') for i, item in enumerate(value)]}
+    arrays[name] = np.asarray(value)
+    return {'array': name}
+
+
+def _unflatten(layout, arrays):
+    if 'dict' in layout:
+        return {key: _unflatten(item, arrays) for key, item in layout['dict'].items()}
+    if 'tuple' in layout:
+        return tuple(_unflatten(item, arrays) for item in layout['tuple'])
+    if 'list' in layout:
+        return [_unflatten(item, arrays) for item in layout['list']]
+    return arrays[layout['array']]
+
+
+class ResultCache:
+    def __init__(self, directory, max_bytes=2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(function, arguments=(), parameters=None, generator=None):
+        description = {'function': f'{function.__module__}.{function.__qualname__}', 'arguments': arguments,
+                       'parameters': parameters, 'code': code_version(function),
+                       'generator': generator.bit_generator.state if generator is not None else None}
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=_jsonable).encode()).hexdigest()
+
+    def _path(self, key):
+        # Path of an existing entry (compressed file or directory of arrays), or None.
+        for path in (os.path.join(self.directory, key + '.npz'), os.path.join(self.directory, key)):
+            if os.path.exists(path):
+                return path
+        return None
+
+    def load(self, key, mmap_mode=None):
+        # Dictionary of the arrays of an entry (memory-mapped with 'mmap_mode' for directories), or None. Marks the
+        # entry as used.
+        path = self._path(key)
+        if path is None:
+            return None
+        os.utime(path)
+        if os.path.isdir(path):
+            return {os.path.splitext(name)[0]: np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+                    for name in os.listdir(path) if name.endswith('.npy')}
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    def save(self, key, arrays, memmap=False):
+        temporary = os.path.join(self.directory, key + '.tmp')
+        if memmap:
+            os.makedirs(temporary, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(os.path.join(temporary, name + '.npy'), array)
+            path = os.path.join(self.directory, key)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        else:
+            with open(temporary, 'wb') as file:
+                np.savez_compressed(file, **arrays)
+            path = os.path.join(self.directory, key + '.npz')
+        os.replace(temporary, path)
+        self.evict(keep=path)
+
+    @staticmethod
+    def _size(path):
+        if not os.path.isdir(path):
+            return os.path.getsize(path)
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+    def evict(self, keep=None):
+        # Remove the least recently used entries until the cache fits in 'max_bytes'.
+        entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                   if not name.endswith('.tmp')]
+        entries.sort(key=os.path.getmtime)
+        total = sum(self._size(path) for path in entries)
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            total -= self._size(path)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+    def call(self, function, *arguments, parameters=None, generator=None, mmap_mode=None):
+        '''
+        'function(*arguments)', loaded from the cache when it was already computed with the same arguments,
+        'parameters', state of 'generator' and code, and computed and stored otherwise. On a hit 'generator' is left
+        in the state the computation left it in. With an 'mmap_mode' ('r' for read-only) the arrays of a hit are
+        memory-mapped instead of read.
+        '''
+        key = self.key(function, arguments, parameters, generator)
+        arrays = self.load(key, mmap_mode)
+        if arrays is not None:
+            if generator is not None:
+                generator.bit_generator.state = json.loads(str(arrays['generator_state']))
+            return _unflatten(json.loads(str(arrays['layout'])), arrays)
+        result = function(*arguments)
+        arrays = {}
+        layout = _flatten(result, arrays)
+        arrays['layout'] = np.array(json.dumps(layout))
+        if generator is not None:
+            arrays['generator_state'] = np.array(json.dumps(generator.bit_generator.state))
+        self.save(key, arrays, memmap=mmap_mode is not None)
+        return result
@@ -0,0 +1,82 @@
+import os
+import glob
+import json
+import numpy as np
+
+'''
+Warm starts for Markov chain simulations: equilibrated states are saved on disk, keyed by (model, size, kT, h,
+replica), together with the state of the bit generator that produced them and, once the measurement is done, its
+results and the parameters of the run.
+
+    -A later run at the same key can start from the saved state instead of equilibrating again.
+    -An annealed sweep starts every temperature from the state saved at the closest temperature already in the cache.
+    -An interrupted run is resumed by taking the results already saved (when they were obtained with the same
+     parameters) and putting the generator back in the state it had right after them, or, for the simulation that was
+     interrupted, right after its equilibration, so a serial run continues with the same random numbers it would have
+     used.
+
+Every entry is a single .npz file, written to a temporary file and then renamed, so an interrupted write never leaves
+a corrupted entry behind.
+'''
+
+
+class StateCache:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, model, size, thermal_energy, h=0., replica=0):
+        return os.path.join(self.directory, f'{model}-N{size}-T{float(thermal_energy)!r}-h{float(h)!r}-r{replica}.npz')
+
+    def save(self, model, size, thermal_energy, h, state, generator=None, replica=0, results=None, parameters=None):
+        path = self.path(model, size, thermal_energy, h, replica)
+        entry = {'state': np.asarray(state, dtype=np.int8),
+                 'generator_state': np.array(json.dumps(generator.bit_generator.state) if generator else ''),
+                 'parameters': np.array(json.dumps(parameters, sort_keys=True))}
+        if results is not None:
+            entry['results'] = np.asarray(results, dtype=float)
+        with open(path + '.tmp', 'wb') as file:
+            np.savez(file, **entry)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def _read(path, thermal_energy):
+        with np.load(path) as data:
+            return {'thermal_energy': thermal_energy,
+                    'state': data['state'],
+                    'generator_state': json.loads(str(data['generator_state'])) if data['generator_state'] else None,
+                    'parameters': json.loads(str(data['parameters'])),
+                    'results': data['results'] if 'results' in data.files else None}
+
+    def load(self, model, size, thermal_energy, h=0., replica=0):
+        # Dictionary with the saved state, generator state, parameters and results (None if not measured yet).
+        path = self.path(model, size, thermal_energy, h, replica)
+        return self._read(path, float(thermal_energy)) if os.path.exists(path) else None
+
+    def nearest(self, model, size, thermal_energy, h=0., replica=0):
+        # Entry with the same model, size, h and replica at the closest temperature (measured in beta = 1/kT), or None.
+        prefix, suffix = f'{model}-N{size}-T', f'-h{float(h)!r}-r{replica}.npz'
+        candidates = {}
+        for path in glob.glob(os.path.join(self.directory, glob.escape(prefix) + '*' + glob.escape(suffix))):
+            candidate = float(os.path.basename(path)[len(prefix):-len(suffix)])
+            if candidate != float(thermal_energy):
+                candidates[candidate] = path
+        if not candidates:
+            return None
+        closest = min(candidates, key=lambda kt: abs(1. / kt - 1. / thermal_energy))
+        return self._read(candidates[closest], closest)
+
+    @staticmethod
+    def resume(entry, parameters, generator=None):
+        '''
+        Results of 'entry' if they were obtained with the same 'parameters', or None. Whenever there is an entry,
+        'generator' is put back in the state it had when the entry was saved: right after the reused results, or right
+        after the equilibration of a run interrupted while measuring, which then measures with the same random numbers.
+        '''
+        if entry is None:
+            return None
+        if generator is not None and entry['generator_state'] is not None:
+            generator.bit_generator.state = entry['generator_state']
+        if entry['results'] is None or entry['parameters'] != json.loads(json.dumps(parameters)):
+            return None
+        return entry['results']
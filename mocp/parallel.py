@@ -0,0 +1,48 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+'''
+Independent replicates on a pool of processes.
+
+Task i always receives a generator built from the i-th child of 'SeedSequence(seed).spawn(tasks)', so its random
+stream depends only on (seed, i): the results are bit-identical for any number of workers and any block size. Tasks
+are sent to the workers in contiguous blocks and every block comes back as a single array.
+
+A task is a module-level function called as 'task(generator, *arguments[i])' that returns a number or an array (of
+the same shape for every task).
+'''
+
+
+def _run_block(task, seeds, arguments):
+    return np.stack([np.asarray(task(np.random.default_rng(seed), *task_arguments))
+                     for seed, task_arguments in zip(seeds, arguments)])
+
+
+def iter_replicates(task, tasks, arguments=None, seed=42, workers=None, block=None):
+    # Yields (first task index, array of results of the block), in order of the task index.
+    seeds = np.random.SeedSequence(seed).spawn(tasks)
+    arguments = [()] * tasks if arguments is None else [tuple(task_arguments) for task_arguments in arguments]
+    workers = os.cpu_count() if workers is None else workers
+    if block is None:
+        block = max(1, -(-tasks // (4 * workers)))  # About 4 blocks per worker to balance the load.
+    starts = range(0, tasks, block)
+    if workers <= 1:
+        for start in starts:
+            yield start, _run_block(task, seeds[start:start + block], arguments[start:start + block])
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_block, task, seeds[start:start + block], arguments[start:start + block])
+                   for start in starts]
+        for start, future in zip(starts, futures):
+            yield start, future.result()
+
+
+def run_replicates(task, tasks, arguments=None, seed=42, workers=None, block=None):
+    # Array with the results of all the tasks stacked along the first axis.
+    results = None
+    for start, results_block in iter_replicates(task, tasks, arguments, seed, workers, block):
+        if results is None:
+            results = np.empty((tasks,) + np.shape(results_block)[1:], dtype=results_block.dtype)
+        results[start:start + len(results_block)] = results_block
+    return results
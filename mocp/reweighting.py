@@ -0,0 +1,144 @@
+import numpy as np
+
+'''
+Histogram reweighting (Ferrenberg and Swendsen, PRL 61 1988 and 63 1989).
+
+A simulation at inverse temperature beta_k samples (E, M) with probability g(E, M) exp(-beta_k E) / Z_k, where g is
+the density of states, so its joint histogram n_k(E, M) estimates g up to a constant and averages at any nearby beta
+follow from weighting every bin with exp(-(beta - beta_k) E) (single histogram). Several simulations are combined
+with the multi-histogram equations (WHAM):
+    g(E, M) = sum_k n_k(E, M) / sum_k N_k exp(f_k - beta_k E),    exp(-f_k) = sum_{E, M} g(E, M) exp(-beta_k E),
+solved by iterating on the free energies f_k. With a single simulation they reduce to the single histogram method.
+Everything is done with logarithms, so the weights never overflow. E is the total energy (including the field term,
+the field being fixed) and M the total magnetisation. With a field h the total energy E = E_bond - h M is not an
+integer, so the histograms count the integer pairs (E_bond, M) and the field term is added back exactly on every bin
+(rounding E itself would move samples between bins and distort the density of states).
+
+Errors come from the jackknife: every simulation splits its samples into the same number of consecutive blocks, the
+curves are recomputed leaving out block b of every simulation, and the spread of these estimates gives the error. Blocks
+longer than the autocorrelation time make the errors account for it.
+'''
+
+
+def logsumexp(values, axis=None):
+    # log(sum(exp(values))) without overflows; -inf entries (empty bins) contribute nothing.
+    largest = np.max(values, axis=axis, keepdims=True)
+    largest = np.where(np.isfinite(largest), largest, 0.)
+    with np.errstate(divide='ignore'):
+        return np.squeeze(largest, axis=axis) + np.log(np.sum(np.exp(values - largest), axis=axis))
+
+
+class JointHistogram:
+    '''
+    Joint histogram of the (E, M) samples of one simulation with field 'field', split into 'blocks' consecutive blocks
+    of the expected number of 'samples' for the jackknife. The bins are the integer pairs (E + field * M, M) of bond
+    energy and magnetisation. Only the bins that were visited are stored.
+    '''
+    def __init__(self, samples, blocks=16, field=0.):
+        self.blocks = blocks
+        self.block_size = max(1, -(-samples // blocks))
+        self.field = float(field)
+        self.recorded = 0
+        self.counts = {}  # (E_bond, M) -> counts in every block.
+
+    def record(self, energies, magnetisations):
+        magnetisations = np.asarray(magnetisations, dtype=float)
+        bond_energies = np.asarray(energies, dtype=float) + self.field * magnetisations
+        rounded = np.rint(bond_energies)
+        if not np.allclose(bond_energies, rounded, rtol=0., atol=1e-6):
+            raise ValueError('The bond energies E + field * M are not integers: is the field of the histogram the one '
+                             'of the simulation?')
+        energies = rounded.astype(np.int64)
+        magnetisations = np.rint(magnetisations).astype(np.int64)
+        block = np.minimum((self.recorded + np.arange(np.size(energies))) // self.block_size, self.blocks - 1)
+        self.recorded += np.size(energies)
+        keys, counts = np.unique(np.stack([block, energies, magnetisations], axis=-1), axis=0, return_counts=True)
+        for (b, energy, magnetisation), count in zip(keys.tolist(), counts.tolist()):
+            self.counts.setdefault((energy, magnetisation), np.zeros(self.blocks, dtype=np.int64))[b] += count
+
+    def table(self):
+        # Total energies and magnetisations of the visited bins, shape (K,), and their counts per block, shape
+        # (blocks, K).
+        bins = sorted(self.counts)
+        magnetisations = np.array([magnetisation for _, magnetisation in bins], dtype=float)
+        energies = np.array([energy for energy, _ in bins], dtype=float) - self.field * magnetisations
+        return energies, magnetisations, np.array([self.counts[key] for key in bins], dtype=float).T
+
+
+def log_density_of_states(counts, sim_betas, energies, tolerance=1e-10, max_iterations=100000, free_energies=None):
+    '''
+    Solve the multi-histogram equations for the counts of every simulation on a common set of bins, shape (S, K).
+    Returns log g on the bins (up to a constant; -inf on the bins no simulation visited) and the free energies f_k.
+    '''
+    sim_betas = np.asarray(sim_betas, dtype=float)[:, np.newaxis]
+    with np.errstate(divide='ignore'):
+        log_total = np.log(np.sum(counts, axis=0))
+        log_samples = np.log(np.sum(counts, axis=1))[:, np.newaxis]
+    free_energies = np.zeros(len(sim_betas)) if free_energies is None else np.array(free_energies)
+    for _ in range(max_iterations):
+        log_g = log_total - logsumexp(log_samples + free_energies[:, np.newaxis] - sim_betas * energies, axis=0)
+        new_free_energies = -logsumexp(log_g - sim_betas * energies, axis=1)
+        new_free_energies -= new_free_energies[0]
+        converged = np.max(np.abs(new_free_energies - free_energies)) < tolerance
+        free_energies = new_free_energies
+        if converged:
+            break
+    return log_g, free_energies
+
+
+def _observables(log_g, energies, magnetisations, betas, spins):
+    # Reweighted averages per spin at every beta from the density of states on the bins.
+    betas = np.asarray(betas, dtype=float)[:, np.newaxis]
+    log_weights = log_g - betas * energies
+    weights = np.exp(log_weights - logsumexp(log_weights, axis=1)[:, np.newaxis])
+    energy = weights @ energies
+    energy_sqr = weights @ energies ** 2
+    magnetisation = weights @ magnetisations
+    abs_magnetisation = weights @ np.abs(magnetisations)
+    magnetisation_sqr = weights @ magnetisations ** 2
+    betas = betas[:, 0]
+    return {
+        'energy': energy / spins,
+        'specific_heat': betas ** 2 * (energy_sqr - energy ** 2) / spins,
+        'magnetisation': magnetisation / spins,
+        'abs_magnetisation': abs_magnetisation / spins,
+        'susceptibility': betas * (magnetisation_sqr - magnetisation ** 2) / spins,
+        'abs_susceptibility': betas * (magnetisation_sqr - abs_magnetisation ** 2) / spins,
+    }
+
+
+def reweight(histograms, sim_betas, betas, spins, jackknife=True):
+    '''
+    Energy, specific heat c_V/k_B, magnetisation, |magnetisation| and susceptibilities (with <M> and with <|M|>), all
+    per spin, at every beta of 'betas' from the 'JointHistogram's of simulations at 'sim_betas' (single histogram
+    reweighting for one simulation, multi-histogram otherwise). Returns a dictionary name -> (values, errors), with
+    jackknife errors (NaN without 'jackknife').
+    Reweighting is only reliable between the betas whose histograms overlap; far from them the curves just follow the
+    tails of the sampled distributions.
+    '''
+    tables = [histogram.table() for histogram in histograms]
+    pairs = np.concatenate([np.stack(table[:2], axis=-1) for table in tables])
+    bins, inverse = np.unique(pairs, axis=0, return_inverse=True)
+    inverse = np.ravel(inverse)
+    blocks = histograms[0].blocks
+    counts = np.zeros((len(histograms), blocks, len(bins)))
+    start = 0
+    for k, (_, _, block_counts) in enumerate(tables):
+        counts[k][:, inverse[start:start + np.shape(block_counts)[1]]] = block_counts
+        start += np.shape(block_counts)[1]
+    energies, magnetisations = bins[:, 0], bins[:, 1]
+
+    log_g, free_energies = log_density_of_states(np.sum(counts, axis=1), sim_betas, energies)
+    estimates = _observables(log_g, energies, magnetisations, betas, spins)
+    errors = {name: np.full(np.shape(values), np.nan) for name, values in estimates.items()}
+    if jackknife:
+        samples = {name: [] for name in estimates}
+        for block in range(blocks):
+            kept = np.sum(np.delete(counts, block, axis=1), axis=1)
+            block_log_g, _ = log_density_of_states(kept, sim_betas, energies, free_energies=free_energies)
+            for name, values in _observables(block_log_g, energies, magnetisations, betas, spins).items():
+                samples[name].append(values)
+        for name in estimates:
+            values = np.array(samples[name])
+            errors[name] = np.sqrt((blocks - 1) / blocks * np.sum((values - np.mean(values, axis=0)) ** 2, axis=0))
+    return {name: (estimates[name], errors[name]) for name in estimates}
@@ -0,0 +1,204 @@
+import json
+import os
+import numpy as np
+
+'''
+Append-only store of configurations and trajectories, for analyses after the run (correlation functions, domain
+sizes, ...) without simulating again.
+
+A store is a directory holding any number of named series. A series is a sequence of items of the same shape, either
+    -'spins': configurations of +1/-1 spins, packed 8 per byte along the last axis (bit = 1 for spin up, least
+     significant bit first, the byte order of the words of 'PackedLattice' in Project2.2), so an L x L lattice takes
+     L^2/8 bytes;
+    -'float32': real arrays such as random walk trajectories, stored in single precision.
+The items are written into segments of at most about 'segment_bytes' bytes, '<name>.00000.npy', '<name>.00001.npy',
+..., memory-mapped with 'open_memmap' and filled in place, and '<name>.json' indexes them: kind, item shape, items per
+segment, items written in each segment and free-form attributes. A segment starts with room for the items being
+written and doubles when it is full (a larger copy is written and renamed over it), so the files take at most twice
+the size of the data. The index is rewritten (to a temporary file, then renamed) on 'flush', so a reader never sees
+items that were not completely written. Every series has its own index, so different processes can write different
+series of the same store at the same time.
+
+'read' gives a 'Series' that memory-maps the segments read-only: items and slices are read on demand, the raw
+(packed) rows of a slice within a segment are a view of the file ('packed'), and independent processes can read the
+same store in parallel.
+'''
+
+
+class Series:
+    def __init__(self, directory, name, index):
+        self.name = name
+        self.kind = index['kind']
+        self.item_shape = tuple(index['shape'])
+        self.attributes = index['attributes']
+        self.segment_size = index['segment_size']
+        self.counts = index['counts']
+        self.segments = [np.load(os.path.join(directory, f'{name}.{k:05d}.npy'), mmap_mode='r')[:count]
+                         for k, count in enumerate(self.counts)]
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def _decode(self, rows):
+        if self.kind == 'float32':
+            return rows
+        bits = np.unpackbits(rows, axis=-1, count=self.item_shape[-1], bitorder='little')
+        return (2 * bits.astype(np.int8) - 1).astype(np.int8)
+
+    def packed(self, index):
+        '''
+        Stored rows of an item (an integer) or of several (a slice or an array of indices). A slice within a single
+        segment is a view of the memory-mapped file; anything else is copied.
+        '''
+        if isinstance(index, (int, np.integer)):
+            position = range(len(self))[index]
+            return self.segments[position // self.segment_size][position % self.segment_size]
+        positions = range(len(self))[index] if isinstance(index, slice) else np.arange(len(self))[index]
+        if isinstance(positions, range) and positions and positions.step > 0:
+            first, last = positions[0] // self.segment_size, positions[-1] // self.segment_size
+            if first == last:
+                offset = first * self.segment_size
+                return self.segments[first][positions.start - offset:positions[-1] - offset + 1:positions.step]
+        positions = np.asarray(positions, dtype=int)
+        rows = np.empty((np.size(positions),) + self.segments[0].shape[1:], dtype=self.segments[0].dtype)
+        for k, segment in enumerate(self.segments):
+            in_segment = positions // self.segment_size == k
+            rows[in_segment] = segment[positions[in_segment] - k * self.segment_size]
+        return rows
+
+    def __getitem__(self, index):
+        # Items unpacked to int8 spins +1/-1, or float32 arrays (views of the file for slices within a segment).
+        return self._decode(self.packed(index))
+
+    def __iter__(self):
+        for segment in self.segments:
+            for rows in segment:
+                yield self._decode(rows)
+
+    def __array__(self, dtype=None, copy=None):
+        items = self[:] if len(self) else np.empty((0,) + self.item_shape)
+        return np.asarray(items) if dtype is None else np.asarray(items).astype(dtype)
+
+
+class SnapshotStore:
+    def __init__(self, directory, segment_bytes=2**26):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.writers = {}  # Name -> [index, memory map of the last segment].
+        os.makedirs(directory, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def _index_path(self, name):
+        if not name or os.sep in name or name.startswith('.'):
+            raise ValueError(f'Not a valid name for a series: {name!r}')
+        return os.path.join(self.directory, name + '.json')
+
+    def _segment_path(self, name, k):
+        return os.path.join(self.directory, f'{name}.{k:05d}.npy')
+
+    def names(self):
+        return sorted(name[:-len('.json')] for name in os.listdir(self.directory) if name.endswith('.json'))
+
+    def _resize(self, name, k, segment, used, capacity, rows):
+        # Segment k of series 'name' with room for 'capacity' rows and the first 'used' rows of 'segment' (or None).
+        path = self._segment_path(name, k)
+        resized = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=rows.dtype,
+                                            shape=(capacity,) + np.shape(rows)[1:])
+        if used:
+            resized[:used] = segment[:used]
+        resized.flush()
+        del resized, segment
+        os.replace(path + '.tmp', path)  # Readers that mapped the old file keep it until they are done.
+        return np.load(path, mmap_mode='r+')
+
+    def _writer(self, name, shape, kind, attributes):
+        if name not in self.writers:
+            path = self._index_path(name)
+            if os.path.exists(path):
+                with open(path) as file:
+                    index = json.load(file)
+                segment = None
+                if index['counts'] and index['counts'][-1] < index['segment_size']:
+                    segment = np.load(self._segment_path(name, len(index['counts']) - 1), mmap_mode='r+')
+            else:
+                if kind not in ('spins', 'float32'):
+                    raise ValueError(f"The kind of a series is 'spins' or 'float32', not {kind!r}")
+                row_bytes = int(np.prod(shape[:-1]) * -(-shape[-1] // 8) if kind == 'spins' else 4 * np.prod(shape))
+                index = {'kind': kind, 'shape': [int(length) for length in shape],
+                         'segment_size': max(1, self.segment_bytes // row_bytes), 'counts': [],
+                         'attributes': attributes or {}}
+                segment = None
+            self.writers[name] = [index, segment]
+        index = self.writers[name][0]
+        if tuple(index['shape']) != tuple(shape) or index['kind'] != kind:
+            raise ValueError(f"Series {name!r} holds {index['kind']} items of shape {tuple(index['shape'])}, not "
+                             f"{kind} items of shape {tuple(shape)}")
+        return self.writers[name]
+
+    def extend(self, name, items, kind='spins', attributes=None):
+        '''
+        Append the items (an array of shape (n,) + item shape) to series 'name', created with the given kind and
+        attributes if it does not exist yet.
+        '''
+        items = np.asarray(items)
+        writer = self._writer(name, np.shape(items)[1:], kind, attributes)
+        index = writer[0]
+        if kind == 'spins':
+            rows = np.packbits(items > 0, axis=-1, bitorder='little')
+        else:
+            rows = items.astype(np.float32)
+        done = 0
+        while done < len(rows):
+            if writer[1] is None:
+                index['counts'].append(0)
+            start = index['counts'][-1]
+            size = min(index['segment_size'] - start, len(rows) - done)
+            if writer[1] is None or len(writer[1]) < start + size:
+                capacity = min(index['segment_size'], max(start + size, 2 * start))
+                writer[1] = self._resize(name, len(index['counts']) - 1, writer[1], start, capacity, rows)
+            writer[1][start:start + size] = rows[done:done + size]
+            index['counts'][-1] += size
+            done += size
+            if index['counts'][-1] == index['segment_size']:
+                writer[1].flush()
+                writer[1] = None
+
+    def append(self, name, item, kind='spins', attributes=None):
+        self.extend(name, np.asarray(item)[np.newaxis], kind, attributes)
+
+    def flush(self):
+        # Write the pending items and the indices to disk.
+        for name, (index, segment) in self.writers.items():
+            if segment is not None:
+                segment.flush()
+            path = self._index_path(name)
+            with open(path + '.tmp', 'w') as file:
+                json.dump(index, file)
+            os.replace(path + '.tmp', path)
+
+    def close(self):
+        self.flush()
+        self.writers = {}
+
+    def remove(self, name):
+        # Delete a series, e.g. to write it again from the start.
+        path = self._index_path(name)
+        segments = len(self.writers.pop(name)[0]['counts']) if name in self.writers else 0
+        if os.path.exists(path):
+            with open(path) as file:
+                segments = max(segments, len(json.load(file)['counts']))
+            os.remove(path)
+        for k in range(segments):
+            if os.path.exists(self._segment_path(name, k)):
+                os.remove(self._segment_path(name, k))
+
+    def read(self, name):
+        if name in self.writers:
+            self.flush()
+        with open(self._index_path(name)) as file:
+            return Series(self.directory, name, json.load(file))
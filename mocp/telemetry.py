@@ -0,0 +1,192 @@
+import contextlib
+import cProfile
+import json
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+'''
+Instrumentation of long runs: timers of the phases of a run (equilibration, measurement, plotting, ...), counters
+(trial and accepted flips, random numbers drawn, ...), a progress stream with throughput and ETA, and optional cProfile
+and tracemalloc captures.
+
+The progress stream has one JSON object per line, written to the file given with --telemetry ('-' for stderr):
+    {"event": "progress", "time": 12.3, "task": "beta sweep", "done": 4, "total": 21, "unit": "betas",
+     "rate": 0.33, "eta": 51.6, ...}
+"time" is in seconds since the start of the run, "rate" in units per second and "eta" in seconds. The last line is a
+"summary" with the total time, the time and number of calls of every phase, the counters and their rates, and the
+peak memory of every phase with --trace_memory. Without a stream the summary goes to stderr as a table.
+
+A 'Telemetry' built without any output is disabled: every method returns at once, so the instrumented code runs at
+full speed. Counting the random numbers means drawing them through 'counting', which wraps the generator only when
+telemetry is on. Numbers drawn straight from the bit generator (the packed lattice of Project2.2) are not counted.
+'''
+
+_DISABLED_PHASE = contextlib.nullcontext()
+
+
+class CountingGenerator:
+    # Stand-in for a NumPy Generator that adds the size of everything its methods return to a counter.
+    def __init__(self, generator, telemetry, counter='random_numbers'):
+        self.generator = generator
+        self.telemetry = telemetry
+        self.counter = counter
+
+    def __getattr__(self, name):
+        attribute = getattr(self.generator, name)
+        if not callable(attribute):
+            return attribute
+
+        def counted(*arguments, **keywords):
+            result = attribute(*arguments, **keywords)
+            self.telemetry.count(self.counter, np.size(result))
+            return result
+        return counted
+
+
+class Telemetry:
+    '''
+    Phase timers, counters and progress events of a run, written as JSON lines to 'stream' (a path, or '-' for
+    stderr). With 'profile' the run is profiled with cProfile and the statistics are dumped to that file (read them
+    with 'python -m pstats'); with 'trace_memory' tracemalloc records the peak memory of every phase and the largest
+    allocation sites. Use it as a context manager around the run; the summary is written on exit.
+    '''
+    def __init__(self, stream=None, profile=None, trace_memory=False):
+        self.enabled = stream is not None or profile is not None or trace_memory
+        self.stream = stream
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.timers = {}  # Phase -> [seconds, calls].
+        self.counters = {}
+        self.peaks = {}  # Phase -> peak traced memory in bytes.
+        self.tasks = {}  # Task -> (time, done) of its first progress event.
+        self.open_phases = []
+        self.file = None
+        self.profiler = None
+        self.start = time.perf_counter()
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.telemetry, args.profile, args.trace_memory)
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        self.start = time.perf_counter()
+        if self.stream is not None:
+            self.file = sys.stderr if self.stream == '-' else open(self.stream, 'w')
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile is not None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.emit('start', argv=sys.argv)
+        return self
+
+    def __exit__(self, *exception):
+        if not self.enabled:
+            return
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile)
+        summary = self.summary()
+        if self.trace_memory:
+            statistics = tracemalloc.take_snapshot().statistics('lineno')[:10]
+            summary['allocations'] = [{'where': str(statistic.traceback), 'bytes': statistic.size}
+                                      for statistic in statistics]
+            tracemalloc.stop()
+        if self.file is not None:
+            self.emit('summary', **summary)
+            if self.file is not sys.stderr:
+                self.file.close()
+            self.file = None
+        else:
+            self.print_summary(summary)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def emit(self, event, **fields):
+        if self.file is not None:
+            self.file.write(json.dumps({'event': event, 'time': self.elapsed(), **fields}, default=float) + '\n')
+            self.file.flush()
+
+    def phase(self, name):
+        # Context manager that adds the time spent inside to the timer of 'name'. Phases can be nested.
+        return self._phase(name) if self.enabled else _DISABLED_PHASE
+
+    @contextlib.contextmanager
+    def _phase(self, name):
+        self._fold_peak()
+        self.open_phases.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timer = self.timers.setdefault(name, [0., 0])
+            timer[0] += time.perf_counter() - start
+            timer[1] += 1
+            self._fold_peak()
+            self.open_phases.pop()
+
+    def _fold_peak(self):
+        # The peak since the last reset belongs to every open phase; then the peak restarts for the next stretch.
+        if not self.trace_memory:
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        for name in self.open_phases:
+            self.peaks[name] = max(self.peaks.get(name, 0), peak)
+        tracemalloc.reset_peak()
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def counting(self, generator):
+        # The generator itself when disabled, a 'CountingGenerator' feeding the 'random_numbers' counter otherwise.
+        return CountingGenerator(generator, self) if self.enabled else generator
+
+    def progress(self, task, done, total, unit='tasks', **fields):
+        # Progress event of 'task' with 'done' of 'total' units. Rate and ETA are measured from its first event.
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        first_time, first_done = self.tasks.setdefault(task, (now, done))
+        rate = (done - first_done) / (now - first_time) if now > first_time else None
+        eta = (total - done) / rate if rate else None
+        self.emit('progress', task=task, done=done, total=total, unit=unit, rate=rate, eta=eta, **fields)
+
+    def summary(self):
+        elapsed = self.elapsed()
+        phases = {name: {'seconds': seconds, 'calls': calls} for name, (seconds, calls) in self.timers.items()}
+        summary = {'seconds': elapsed, 'phases': phases,
+                   'counters': dict(self.counters),
+                   'rates': {name: value / elapsed for name, value in self.counters.items()}}
+        if self.trace_memory:
+            self._fold_peak()
+            summary['peak_bytes'] = dict(self.peaks)
+        return summary
+
+    @staticmethod
+    def print_summary(summary):
+        print(f'Total time: {summary["seconds"]:.3f} s', file=sys.stderr)
+        for name, timer in summary['phases'].items():
+            peak = summary.get('peak_bytes', {}).get(name)
+            memory = '' if peak is None else f' {peak / 2 ** 20:10.2f} MiB peak'
+            print(f'{name:>20} {timer["seconds"]:10.3f} s {timer["calls"]:8d} calls{memory}', file=sys.stderr)
+        for name, value in summary['counters'].items():
+            print(f'{name:>20} {value:14d} {summary["rates"][name]:12.4e}/s', file=sys.stderr)
+        for allocation in summary.get('allocations', []):
+            print(f'{allocation["bytes"] / 2 ** 20:10.2f} MiB {allocation["where"]}', file=sys.stderr)
+
+
+def add_arguments(parser):
+    # The command line flags read by 'Telemetry.from_args'.
+    parser.add_argument('--telemetry', type=str, default=None,
+                        help="Write progress (with throughput and ETA), phase timers and counters as JSON lines to "
+                             "this file ('-' for stderr)")
+    parser.add_argument('--profile', type=str, default=None,
+                        help="Profile the run with cProfile and dump the statistics to this file")
+    parser.add_argument('--trace_memory', default=False, action="store_true",
+                        help="Record the peak memory of every phase and the largest allocation sites with tracemalloc")
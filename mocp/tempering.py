@@ -0,0 +1,130 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from mocp.accumulators import Observable
+
+'''
+Parallel tempering (replica exchange) over a grid of inverse temperatures beta_0 < beta_1 < ... < beta_{R-1}.
+
+Every round, each replica is advanced 'sweeps' steps at the beta of its slot, and then swaps of the replicas of
+neighbouring slots (i, i+1) are proposed, alternating between the pairs with even and odd i, with probability
+min(1, exp((beta_i - beta_{i+1}) (E_i - E_{i+1}))). Replicas stuck in a metastable state at low temperature can
+travel to high temperature, decorrelate and come back.
+
+The replicas are advanced in one of three ways:
+    -'vectorized': a single call update(states, betas, sweeps, generator) on the stacked states, with one beta per
+     replica (e.g. the checkerboard sweeps of Project2.2).
+    -In process, one call update(state, beta, sweeps, generator) per replica, each with its own random stream.
+    -On a pool of 'workers' processes, the same calls shipped with their states and generators. The streams come from
+     'SeedSequence(seed).spawn(R)' as in 'mocp.parallel', so the results do not depend on the number of workers.
+The update returns the work done in sweeps; 'energy(state)' and 'observable(state)' evaluate the energy used in the
+swaps and the measured quantity (both on the stacked states in the vectorized mode).
+
+During the 'equilibration' rounds the grid can be adapted to equalise the swap acceptance of all the pairs; the
+measurements, acceptance rates and round trips (hottest slot -> coldest slot -> hottest slot) come from the remaining
+rounds, with the grid fixed.
+'''
+
+
+def _advance(update, energy, observable, state, beta, sweeps, generator):
+    work = update(state, beta, sweeps, generator)
+    return state, generator, energy(state), observable(state), work
+
+
+def exchange(betas, energies, replicas, parity, generator):
+    '''
+    Propose swaps between the slots (i, i + 1) with i % 2 == parity. 'replicas[i]' is the replica in slot i and is
+    updated in place. Returns a boolean array over the R - 1 pairs with the accepted swaps.
+    '''
+    pairs = np.arange(parity, len(betas) - 1, 2)
+    lower, upper = replicas[pairs], replicas[pairs + 1]
+    log_ratio = (betas[pairs] - betas[pairs + 1]) * (energies[lower] - energies[upper])
+    accepted = np.log(generator.random(np.size(pairs))) < log_ratio
+    replicas[pairs[accepted]], replicas[pairs[accepted] + 1] = upper[accepted], lower[accepted]
+    swaps = np.zeros(len(betas) - 1, dtype=bool)
+    swaps[pairs[accepted]] = True
+    return swaps
+
+
+def respace(betas, acceptance, floor=0.01):
+    '''
+    New grid with the same ends that equalises the swap acceptance A_i of the pairs, assuming -ln(A_i) grows as the
+    square of the gap: gap_i -> gap_i / sqrt(-ln(A_i)), normalised, and averaged with the old gap to damp the feedback.
+    '''
+    gaps = np.diff(betas)
+    new_gaps = gaps / np.sqrt(-np.log(np.clip(acceptance, floor, 1. - floor)))
+    new_gaps = 0.5 * (gaps + new_gaps * (betas[-1] - betas[0]) / np.sum(new_gaps))
+    return betas[0] + np.concatenate(([0.], np.cumsum(new_gaps)))
+
+
+def parallel_tempering(update, energy, observable, states, betas, rounds, sweeps=1, equilibration=0, adapt=False,
+                       adapt_every=50, vectorized=False, workers=0, seed=42, generator=None):
+    '''
+    Run 'equilibration' + 'rounds' rounds of parallel tempering from the given states (a stacked array in the
+    vectorized mode, a list otherwise), one per beta in increasing order. 'generator' draws the swaps (and the updates
+    in the vectorized mode). Returns a dictionary with the final betas, the 'Observable' of the measured quantity per
+    slot (in slot order), the swap acceptance per pair, the round trip times in rounds, the mean work per round (in
+    sweeps) and the final states.
+    '''
+    if generator is None:
+        generator = np.random.default_rng(seed)
+    betas = np.array(betas, dtype=float)
+    slots = len(betas)
+    replicas = np.arange(slots)  # Replica in every slot.
+    generators = [np.random.default_rng(child) for child in np.random.SeedSequence(seed).spawn(slots)]
+    measured = Observable(shape=slots)
+    attempts = np.zeros(slots - 1)
+    accepted = np.zeros(slots - 1)
+    label = np.zeros(slots, dtype=int)  # +1 after visiting the hottest slot, -1 after the coldest one.
+    last_hottest = np.zeros(slots)
+    round_trips = []
+    work = 0.
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and not vectorized else None
+    try:
+        for step in range(equilibration + rounds):
+            replica_betas = np.empty(slots)
+            replica_betas[replicas] = betas
+            if vectorized:
+                work += update(states, replica_betas, sweeps, generator)
+                energies, values = energy(states), observable(states)
+            else:
+                arguments = [(update, energy, observable, states[r], replica_betas[r], sweeps, generators[r])
+                             for r in range(slots)]
+                if pool is None:
+                    outcomes = [_advance(*replica_arguments) for replica_arguments in arguments]
+                else:
+                    outcomes = list(pool.map(_advance, *zip(*arguments)))
+                states = [outcome[0] for outcome in outcomes]
+                generators = [outcome[1] for outcome in outcomes]
+                energies = np.array([outcome[2] for outcome in outcomes], dtype=float)
+                values = np.array([outcome[3] for outcome in outcomes], dtype=float)
+                work += np.mean([outcome[4] for outcome in outcomes])
+            if step >= equilibration:
+                measured.record(np.asarray(values)[replicas][np.newaxis])
+            parity = step % 2
+            swaps = exchange(betas, np.asarray(energies, dtype=float), replicas, parity, generator)
+            attempts[parity::2] += 1
+            accepted += swaps
+            adapting = adapt and step < equilibration and (step + 1) % adapt_every == 0
+            if adapting:
+                betas = respace(betas, accepted / np.maximum(attempts, 1))
+            if adapting or step + 1 == equilibration:  # Start counting afresh.
+                attempts[:] = 0.
+                accepted[:] = 0.
+                work = 0.
+            if step >= equilibration:
+                # A round trip ends when a replica that has visited the coldest slot comes back to the hottest one.
+                hottest, coldest = replicas[0], replicas[-1]
+                if label[hottest] == -1:
+                    round_trips.append(step - last_hottest[hottest])
+                if label[hottest] != 1:
+                    last_hottest[hottest] = step
+                label[hottest] = 1
+                if label[coldest] == 1:
+                    label[coldest] = -1
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return {'betas': betas, 'observable': measured, 'acceptance': accepted / np.maximum(attempts, 1),
+            'round_trips': np.array(round_trips, dtype=float), 'work_per_round': work / max(rounds, 1),
+            'states': states}
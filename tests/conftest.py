@@ -0,0 +1,29 @@
+import functools
+import importlib.util
+import os
+import sys
+import pytest
+
+os.environ.setdefault('MPLBACKEND', 'Agg')  # The project scripts import pyplot; nothing is plotted here.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@functools.lru_cache(maxsize=None)
+def load_script(path):
+    # A project script (e.g. 'Project2/Project2.2.py') as a module, with its directory on 'sys.path' for its siblings.
+    directory = os.path.join(ROOT, os.path.dirname(path))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    name = os.path.splitext(os.path.basename(path))[0].replace('.', '_')
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def script():
+    return load_script
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from scipy import stats
+from mocp.accumulators import RunningStats, BinningAnalysis, Observable
+
+
+def test_running_stats_matches_numpy():
+    values = np.random.default_rng(0).gamma(2., size=(10001, 3))
+    running = RunningStats(shape=3)
+    for chunk in np.array_split(values, [1, 2, 500, 501, 7000]):
+        running.update(chunk)
+    assert running.count == len(values)
+    assert np.allclose(running.mean, np.mean(values, axis=0))
+    assert np.allclose(running.variance, np.var(values, axis=0, ddof=1))
+    assert np.allclose(running.skewness, stats.skew(values, axis=0))
+    assert np.allclose(running.kurtosis, stats.kurtosis(values, axis=0))
+
+
+def test_running_mean_does_not_drift():
+    # Many small chunks of values with a large offset: the compensated sums keep the mean and variance exact.
+    running = RunningStats()
+    for _ in range(10000):
+        running.update(1e8 + np.array([0.1, 0.2, 0.3]))
+    assert running.mean == pytest.approx(1e8 + 0.2, abs=1e-7)
+    assert running.variance == pytest.approx(np.var([0.1, 0.2, 0.3], ddof=0) * 30000 / 29999, rel=1e-6)
+
+
+def test_binning_finds_the_autocorrelation_time():
+    # AR(1) series x_t = phi x_{t-1} + noise has tau_int = (1 + phi) / (2 (1 - phi)).
+    phi = 0.8
+    noise = np.random.default_rng(1).normal(size=2 ** 18)
+    series = np.empty_like(noise)
+    series[0] = noise[0]
+    for t in range(1, len(noise)):
+        series[t] = phi * series[t - 1] + noise[t]
+    binning = BinningAnalysis()
+    for chunk in np.array_split(series, 37):
+        binning.update(chunk)
+    assert binning.tau_int == pytest.approx((1. + phi) / (2. * (1. - phi)), rel=0.15)
+
+
+def test_observable_interval_across_chunks():
+    values = np.arange(100.)
+    observable = Observable(interval=3, keep_series=True)
+    for chunk in np.array_split(values, [7, 8, 50]):
+        observable.record(chunk)
+    assert np.array_equal(observable.series, values[::3])
+    assert observable.stats.mean == pytest.approx(np.mean(values[::3]))
@@ -0,0 +1,23 @@
+from mocp import benchmark
+
+
+def results(throughput, peak_bytes):
+    return {'results': [{'kernel': 'random_walk', 'size': 1000, 'unit': 'steps', 'work': 1000, 'seconds': 1.,
+                         'throughput': throughput, 'peak_bytes': peak_bytes}]}
+
+
+def test_compare_flags_regressions():
+    baseline = results(1000., 10 ** 6)
+    assert benchmark.compare(baseline, results(900., 1.1 * 10 ** 6), tolerance=0.2) == []
+    assert len(benchmark.compare(baseline, results(500., 10 ** 6), tolerance=0.2)) == 1
+    assert len(benchmark.compare(baseline, results(1000., 2 * 10 ** 6), tolerance=0.2)) == 1
+    assert benchmark.compare(baseline, {'results': []}) == []
+
+
+def test_run_reports_every_size():
+    report = benchmark.run(['random_walk', 'trial_spin_flips_fast'], quick=True, repeats=1, verbose=False)
+    entries = [(entry['kernel'], entry['size']) for entry in report['results']]
+    assert entries == [('random_walk', size) for size in benchmark.benchmarks['random_walk']['quick_sizes']] + [
+        ('trial_spin_flips_fast', size) for size in benchmark.benchmarks['trial_spin_flips_fast']['quick_sizes']]
+    assert all(entry['throughput'] > 0 and entry['peak_bytes'] > 0 for entry in report['results'])
+    assert benchmark.compare(report, report) == []
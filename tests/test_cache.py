@@ -0,0 +1,53 @@
+import os
+import numpy as np
+from mocp.cache import ResultCache
+
+stream = np.random.default_rng(7)  # The generator the cached function draws from, like the 'rng' of the scripts.
+calls = []
+
+
+def simulation(size):
+    calls.append(size)
+    return {'values': stream.random(size), 'summary': (np.arange(3), [np.float64(size)])}
+
+
+def test_hit_matches_miss_and_restores_the_generator(tmp_path):
+    global stream
+    cache = ResultCache(tmp_path)
+    results = []
+    for _ in range(2):
+        stream = np.random.default_rng(7)
+        results.append(cache.call(simulation, 5, parameters={'flag': 1}, generator=stream))
+        results.append(stream.random())  # The next number drawn after the call.
+    assert calls.count(5) == 1
+    miss, next_after_miss, hit, next_after_hit = results
+    assert np.array_equal(miss['values'], hit['values'])
+    assert np.array_equal(hit['summary'][0], np.arange(3)) and hit['summary'][1][0] == 5.
+    assert next_after_miss == next_after_hit
+
+
+def test_memory_mapped_hit(tmp_path):
+    cache = ResultCache(tmp_path)
+    miss = cache.call(simulation, 1000, generator=np.random.default_rng(0), mmap_mode='r')
+    hit = cache.call(simulation, 1000, generator=np.random.default_rng(0), mmap_mode='r')
+    assert isinstance(hit['values'], np.memmap) and not hit['values'].flags.writeable
+    assert np.array_equal(miss['values'], hit['values'])
+
+
+def test_key_depends_on_arguments_parameters_and_seed():
+    key = ResultCache.key(simulation, (5,), {'flag': 1}, np.random.default_rng(0))
+    assert key == ResultCache.key(simulation, (5,), {'flag': 1}, np.random.default_rng(0))
+    assert key != ResultCache.key(simulation, (6,), {'flag': 1}, np.random.default_rng(0))
+    assert key != ResultCache.key(simulation, (5,), {'flag': 2}, np.random.default_rng(0))
+    assert key != ResultCache.key(simulation, (5,), {'flag': 1}, np.random.default_rng(1))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(tmp_path)
+    for i in range(4):  # 80 kB each, written at times 0, 1, 2 and 3.
+        cache.save(str(i), {'values': np.full(10 ** 4, i, dtype=np.float64)}, memmap=True)
+        os.utime(tmp_path / str(i), (i, i))
+    cache.load('0')  # Used again: now the most recent.
+    cache.max_bytes = 3 * 10 ** 5
+    cache.evict()
+    assert sorted(os.listdir(tmp_path)) == ['0', '2', '3']
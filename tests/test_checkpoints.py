@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from mocp.checkpoints import StateCache
+
+TEMPERATURES = (1.5, 2.)
+
+
+def serial_run(module, checkpoints=None, seed=7, **keywords):
+    # Parts c) to e) on a single stream: every task continues from the generator state left by the previous one.
+    generator = np.random.default_rng(seed)
+    return [module.equilibrium_task(generator, 20, kt, 0.2, 2000, checkpoints=checkpoints, **keywords)
+            for kt in TEMPERATURES]
+
+
+def test_saved_results_are_reused(script, tmp_path):
+    module = script('Project2/Project2.1.py')
+    first = serial_run(module, str(tmp_path))
+    # A different seed: nothing is simulated, so the results and the final generator come from the entries.
+    assert np.array_equal(serial_run(module, str(tmp_path), seed=8), first)
+    assert np.array_equal(first, serial_run(module))
+
+
+def test_interrupted_run_resumes_identically(script, tmp_path):
+    module = script('Project2/Project2.1.py')
+    uninterrupted = serial_run(module)
+    # The run is interrupted while measuring the second temperature, after saving its equilibrated state.
+    generator = np.random.default_rng(7)
+    module.equilibrium_task(generator, 20, TEMPERATURES[0], 0.2, 2000, checkpoints=str(tmp_path))
+    state = module.down_state(20)
+    module.kernels['python'](state, TEMPERATURES[1], 2000, 0.2, generator)
+    StateCache(str(tmp_path)).save('ising1d', 20, TEMPERATURES[1], 0.2, state, generator)
+    assert np.array_equal(serial_run(module, str(tmp_path), seed=8), uninterrupted)
+
+
+def test_parameters_must_match(script, tmp_path):
+    module = script('Project2/Project2.1.py')
+    serial_run(module, str(tmp_path))
+    entry = StateCache(str(tmp_path)).load('ising1d', 20, TEMPERATURES[0], 0.2)
+    assert StateCache.resume(entry, {'flips': 2000, 'kernel': 'python', 'interval': 1}) is not None
+    assert StateCache.resume(entry, {'flips': 4000, 'kernel': 'python', 'interval': 1}) is None
+
+
+def test_nearest_is_closest_in_beta(tmp_path):
+    cache = StateCache(str(tmp_path))
+    for kt in (1., 2., 10.):
+        cache.save('ising1d', 20, kt, 0., np.full(20, int(kt), dtype=np.int8))
+    # 1/4 is closer to 1/10 than to 1/2 although 4 is closer to 2.
+    assert cache.nearest('ising1d', 20, 4.)['thermal_energy'] == 10.
+    # The entry at the same temperature is not a neighbour: beta = 0.1 is closer to 0.5 than beta = 1.
+    assert cache.nearest('ising1d', 20, 2.)['thermal_energy'] == 10.
+    assert cache.nearest('ising1d', 20, 2., h=0.1) is None
+
+
+def test_anneal_starts_from_nearest_state(script, tmp_path):
+    module = script('Project2/Project2.1.py')
+    generator = np.random.default_rng(3)
+    module.equilibrium_task(generator, 20, 1., 0.2, 2000, checkpoints=str(tmp_path))
+    annealed = module.equilibrium_task(np.random.default_rng(4), 20, 1.2, 0.2, 2000, checkpoints=str(tmp_path),
+                                       anneal=True, warm_flips=50)
+    # The same simulation by hand: the state saved at kT = 1, 50 warm trial flips, then the measurement.
+    generator = np.random.default_rng(4)
+    state = module.down_state(20)
+    state[:] = StateCache(str(tmp_path)).load('ising1d', 20, 1., 0.2)['state'].tolist()
+    module.kernels['python'](state, 1.2, 50, 0.2, generator)
+    energies, magnetisation_values = module.trial_spin_flips(state, 1.2, 2000, 0.2, generator)
+    assert annealed[0] == pytest.approx(np.mean(energies))
+    assert annealed[2] == pytest.approx(np.mean(magnetisation_values))
+
+
+def test_interrupted_beta_sweep_resumes_identically(script, tmp_path):
+    module = script('Project2/Project2.2.py')
+
+    def sweep(checkpoints=None, seed=7):
+        generator = np.random.default_rng(seed)
+        return [module.beta_task(generator, beta, 8, 50, 1, checkpoints=checkpoints, equilibration=20)
+                for beta in (0.3, 0.5)]
+    uninterrupted = sweep()
+    generator = np.random.default_rng(7)
+    module.beta_task(generator, 0.3, 8, 50, 1, checkpoints=str(tmp_path), equilibration=20)
+    state = module.down_lattice(8, 'metropolis')
+    for _ in range(20):
+        module.updates['metropolis'](state, 0.5, 1, generator)
+    StateCache(str(tmp_path)).save('ising2d', 8, 1. / 0.5, 0., state, generator)
+    assert np.array_equal(sweep(str(tmp_path), seed=8), uninterrupted)
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+
+def test_compiled_and_python_chains_are_identical(script, monkeypatch):
+    module = script('Project2/Project2.1.py')
+    if module.njit is None:
+        pytest.skip('Numba is not installed')
+    runs = []
+    for compiled in (True, False):
+        if not compiled:
+            monkeypatch.setattr(module, 'njit', None)
+            monkeypatch.setattr(module, 'metropolis_chain', module.metropolis_chain.py_func)
+        state = module.down_state(20, 'table')
+        energies, magnetisations = module.trial_spin_flips_fast(state, 1.5, 10 ** 5, 0.1,
+                                                                generator=np.random.default_rng(4), block=1000)
+        runs.append((energies, magnetisations, state))
+    for compiled, python in zip(*runs):
+        assert np.array_equal(compiled, python)
+
+
+@pytest.mark.parametrize('kernel, flips', [('python', 10 ** 6), ('table', 2 * 10 ** 6)])
+def test_kernels_match_exact_energy(script, kernel, flips):
+    # Time average of the energy per spin of a 20 spin ring at kT = 2, h = 0.5 against the transfer matrix.
+    module = script('Project2/Project2.1.py')
+    state = module.down_state(20, kernel)
+    generator = np.random.default_rng(2)
+    module.kernels[kernel](state, 2., 10 ** 4, 0.5, generator)
+    energies, _ = module.kernels[kernel](state, 2., flips, 0.5, generator)
+    exact = script('Project2/transfer_matrix.py').exact_observables(20, 2., 0.5)['energy']
+    assert np.mean(energies) / 20 == pytest.approx(exact, abs=0.012)
+
+
+@pytest.mark.parametrize('h', [0., 0.5])
+def test_sublattice_sweeps_match_exact(script, monkeypatch, h):
+    # <E>/N and <M>/N of the simultaneous sublattice updates against the transfer matrix, within 4 binning errors.
+    module = script('Project2/Project2.1.py')
+    monkeypatch.setattr(module, 'rng', np.random.default_rng(5))
+    thermal_energies = np.array([1., 2., 10.])
+    results = module.replica_equilibrium(20, thermal_energies, [h], 4, 20 * 4000, interval=1)[0]
+    exact = script('Project2/transfer_matrix.py').exact_observables(20, thermal_energies, h)
+    for column, error_column, name in ((0, 3, 'energy'), (2, 4, 'magnetisation')):
+        mean = np.mean(results[..., column], axis=1) / 20
+        error = np.sqrt(np.sum(results[..., error_column] ** 2, axis=1)) / 4 / 20
+        assert np.all(np.abs(mean - exact[name]) < 4 * error + 1e-3), (name, mean, exact[name], error)
@@ -0,0 +1,90 @@
+import itertools
+import numpy as np
+import pytest
+from scipy.stats import binom
+from mocp.accumulators import Observable
+
+LENGTH = 8
+
+
+def random_spins_magnetisation(spins):
+    # <|M|> / N of N independent spins, the beta = 0 value of <|m|>.
+    k = np.arange(spins + 1)
+    return np.sum(binom.pmf(k, spins, 0.5) * np.abs(2 * k - spins)) / spins
+
+
+def mean_abs_magnetisation(module, update, beta, configurations, steps, length=LENGTH, seed=1):
+    generator = np.random.default_rng(seed)
+    state = module.down_lattice(length, update)
+    module.updates[update](state, beta, 10 * steps, generator)
+    values = np.empty(configurations)
+    for i in range(configurations):
+        module.updates[update](state, beta, steps, generator)
+        values[i] = module.magnetisation_per_spin(state)
+    return np.mean(values)
+
+
+@pytest.mark.parametrize('update, steps', [('metropolis', 2), ('checkerboard', 1), ('swendsen-wang', 1),
+                                           ('wolff', LENGTH ** 2)])
+def test_infinite_temperature(script, update, steps):
+    # At beta = 0 every update must give independent random spins, not a deterministic flip of whole sublattices.
+    module = script('Project2/Project2.2.py')
+    expected = random_spins_magnetisation(LENGTH ** 2)
+    assert mean_abs_magnetisation(module, update, 0., 2000, steps) == pytest.approx(expected, abs=0.01)
+
+
+def test_acceptance_table_is_heat_bath(script):
+    module = script('Project2/Project2.2.py')
+    table = module.acceptance_table([0., 0.3])
+    assert np.allclose(table[0], 0.5)
+    assert np.allclose(table[1], 1. / (1. + np.exp(0.3 * 2. * np.arange(-4, 5, 2))))
+
+
+def mean_observables(module, update, beta, configurations, equilibration, length):
+    generator = np.random.default_rng(3)
+    state = module.down_lattice(length, update)
+    module.updates[update](state, beta, equilibration, generator)
+    values = np.empty((configurations, 2))
+    for i in range(configurations):
+        module.updates[update](state, beta, 1, generator)
+        values[i] = module.magnetisation_per_spin(state), module.lattice_energy(state) / length ** 2
+    return np.mean(values, axis=0)
+
+
+@pytest.mark.parametrize('beta', [0., 0.2, 0.3, 0.6])
+def test_packed_matches_metropolis(script, beta):
+    # <|m|> and <E>/N of the multi-spin-coded sweeps against random site Metropolis on a 64 x 64 lattice.
+    module = script('Project2/Project2.2.py')
+    packed = mean_observables(module, 'packed', beta, 400, 50, 64)
+    metropolis = mean_observables(module, 'metropolis', beta, 60, 20, 64)
+    assert packed[0] == pytest.approx(metropolis[0], abs=0.01)
+    assert packed[1] == pytest.approx(metropolis[1], abs=0.015)
+    if beta == 0.:
+        assert packed[0] == pytest.approx(random_spins_magnetisation(64 ** 2), abs=0.002)
+
+
+def enumerated_observables(module, length, beta):
+    # Exact <|m|> and <E>/N of the periodic L x L lattice by summing over all its configurations.
+    states = np.array(list(itertools.product([-1, 1], repeat=length ** 2)), dtype=np.int8).reshape(-1, length, length)
+    energies = module.lattice_energy(states)
+    weights = np.exp(-beta * (energies - np.min(energies)))
+    weights /= np.sum(weights)
+    return np.array([weights @ np.abs(module.total_magnetisation(states)), weights @ energies]) / length ** 2
+
+
+@pytest.mark.parametrize('beta', [0.3, 0.44, 0.6])
+@pytest.mark.parametrize('update, steps', [('metropolis', 1), ('checkerboard', 1), ('wolff', 2), ('swendsen-wang', 1)])
+def test_updates_match_enumeration(script, update, steps, beta):
+    # Single spin and cluster updates on a 4 x 4 lattice against exact sums, within 4 binning errors.
+    module = script('Project2/Project2.2.py')
+    generator = np.random.default_rng(3)
+    state = module.down_lattice(4, update)
+    module.updates[update](state, beta, 20 * steps, generator)
+    observables = Observable(shape=2)
+    values = np.empty((4096, 2))
+    for i in range(len(values)):
+        module.updates[update](state, beta, steps, generator)
+        values[i] = module.magnetisation_per_spin(state), module.lattice_energy(state) / 16
+    observables.record(values)
+    exact = enumerated_observables(module, 4, beta)
+    assert np.all(np.abs(observables.stats.mean - exact) < 4. * observables.binning.error)
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+
+def test_ensemble_mean_square_distance(script):
+    # Unit steps in random directions: <R_N^2> = N.
+    module = script('Project1/Project1.2.py')
+    checkpoints = [10, 100, 1000]
+    _, mean_r2, r2_error = module.walk_ensemble(2000, 1000, checkpoints, generator=np.random.default_rng(0))
+    assert np.all(np.abs(mean_r2 - checkpoints) < 4. * r2_error)
+
+
+def test_ensemble_rejects_bad_arguments(script):
+    module = script('Project1/Project1.2.py')
+    with pytest.raises(ValueError):
+        module.walk_ensemble(10, 100, [50, 200])
+    with pytest.raises(ValueError):
+        module.walk_ensemble(1, 100, [50])
@@ -0,0 +1,46 @@
+import itertools
+import numpy as np
+import pytest
+from mocp.reweighting import JointHistogram, reweight
+
+SPINS = 10
+FIELD = 0.1
+THERMAL_ENERGIES = np.array([1., 1.5, 2., 3., 5.])
+
+
+def all_states(spins):
+    states = np.array(list(itertools.product([-1, 1], repeat=spins)))
+    energies = -np.sum(states * np.roll(states, -1, axis=1), axis=1) - FIELD * np.sum(states, axis=1)
+    return energies, np.sum(states, axis=1)
+
+
+def test_density_of_states_is_exact(script):
+    # Every configuration once is an exact beta = 0 histogram, so reweighting it must give the exact ring.
+    exact = script('Project2/transfer_matrix.py').exact_observables(SPINS, THERMAL_ENERGIES, FIELD)
+    histogram = JointHistogram(2 ** SPINS, field=FIELD)
+    histogram.record(*all_states(SPINS))
+    curves = reweight([histogram], [0.], 1. / THERMAL_ENERGIES, SPINS, jackknife=False)
+    for name in ('energy', 'specific_heat', 'magnetisation', 'susceptibility'):
+        assert curves[name][0] == pytest.approx(exact[name], rel=1e-9, abs=1e-12)
+
+
+def test_wrong_field_is_rejected():
+    histogram = JointHistogram(2 ** SPINS)
+    with pytest.raises(ValueError):
+        histogram.record(*all_states(SPINS))
+
+
+def test_multi_histogram_matches_exact(script):
+    # Metropolis runs at kT = 1, 2 and 3 reweighted in between, against the transfer matrix (within 4 errors).
+    module = script('Project2/Project2.1.py')
+    exact = script('Project2/transfer_matrix.py').exact_observables(SPINS, THERMAL_ENERGIES[:4], FIELD)
+    generator = np.random.default_rng(5)
+    histograms = []
+    for thermal_energy in (1., 2., 3.):
+        histograms.append(JointHistogram(20 * 20001, field=FIELD))
+        for _ in range(20):
+            histograms[-1].record(*module.series_task(generator, SPINS, thermal_energy, FIELD, 20000, 'table'))
+    curves = reweight(histograms, [1., 1. / 2., 1. / 3.], 1. / THERMAL_ENERGIES[:4], SPINS)
+    for name in ('energy', 'specific_heat', 'magnetisation'):
+        values, errors = curves[name]
+        assert np.all(np.abs(values - exact[name]) < 4. * errors)
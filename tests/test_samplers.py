@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('sampler', ['random', 'sobol', 'halton', 'stratified', 'lhs'])
+def test_unit_samples(script, sampler):
+    points = script('Project1/Project1.1.py').unit_samples(sampler, 256, replicates=3)
+    assert np.shape(points) == (3, 256)
+    assert np.all((points >= 0.) & (points < 1.))
+
+
+def test_sobol_is_balanced(script):
+    # Every one of the 2^m dyadic intervals of width 2^-m holds exactly one of the first 2^m Sobol' points.
+    points = script('Project1/Project1.1.py').unit_samples('sobol', 256)[0]
+    assert np.array_equal(np.sort(np.floor(points * 256)), np.arange(256))
+
+
+def test_sobol_needs_a_power_of_two(script):
+    with pytest.raises(ValueError):
+        script('Project1/Project1.1.py').unit_samples('sobol', 1000)
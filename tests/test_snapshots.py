@@ -0,0 +1,41 @@
+import os
+import numpy as np
+import pytest
+from mocp.snapshots import SnapshotStore
+
+
+def test_spins_round_trip(tmp_path):
+    generator = np.random.default_rng(0)
+    states = generator.choice(np.array([-1, 1], dtype=np.int8), size=(50, 12, 20))
+    with SnapshotStore(tmp_path, segment_bytes=12 * 3 * 16) as store:  # 16 items per segment.
+        for state in states[:20]:
+            store.append('lattice', state, attributes={'beta': 0.4})
+        store.extend('lattice', states[20:])
+    series = SnapshotStore(tmp_path).read('lattice')
+    assert len(series) == 50 and series.item_shape == (12, 20) and series.attributes == {'beta': 0.4}
+    assert np.array_equal(np.asarray(series), states)
+    assert np.array_equal(series[17:40:3], states[17:40:3])
+    assert np.array_equal(series[[49, 0, 16]], states[[49, 0, 16]])
+    assert np.array_equal(series[-1], states[-1])
+    assert np.shares_memory(series.packed(slice(2, 9)), series.segments[0])
+
+
+def test_reopen_and_append(tmp_path):
+    walks = np.random.default_rng(1).normal(size=(7, 30, 2))
+    with SnapshotStore(tmp_path) as store:
+        store.extend('walks', walks[:3], kind='float32')
+    with SnapshotStore(tmp_path) as store:
+        store.extend('walks', walks[3:], kind='float32')
+        with pytest.raises(ValueError):
+            store.extend('walks', walks[:, :10], kind='float32')
+    series = SnapshotStore(tmp_path).read('walks')
+    assert np.array_equal(np.asarray(series), walks.astype(np.float32))
+
+
+def test_segments_grow_with_the_data(tmp_path):
+    # A few small items must not take the preallocated size of a whole segment.
+    with SnapshotStore(tmp_path) as store:
+        for _ in range(50):
+            store.append('small', np.ones((64, 64), dtype=np.int8))
+    assert os.path.getsize(tmp_path / 'small.00000.npy') < 2 * 50 * 64 * 64 // 8 + 1024
+    assert len(SnapshotStore(tmp_path).read('small')) == 50
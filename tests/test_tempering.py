@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from mocp.tempering import exchange, parallel_tempering, respace
+from test_ising2d import enumerated_observables
+
+
+def test_exchange_follows_acceptance_rule():
+    # Every proposed swap is accepted with probability min(1, exp((beta_i - beta_{i+1}) (E_i - E_{i+1}))).
+    betas = np.array([0.1, 0.3, 0.4, 0.7, 0.8])
+    energies = np.array([-3., 5., -1., 2., -8.])
+    for parity in (0, 1):
+        replicas = np.arange(5)
+        uniforms = np.random.default_rng(6).random(np.size(np.arange(parity, 4, 2)))
+        swaps = exchange(betas, energies, replicas, parity, np.random.default_rng(6))
+        pairs = np.arange(parity, 4, 2)
+        expected = uniforms < np.minimum(1., np.exp((betas[pairs] - betas[pairs + 1]) * (energies[pairs] -
+                                                                                         energies[pairs + 1])))
+        assert np.array_equal(swaps[pairs], expected)
+        assert not np.any(np.delete(swaps, pairs))
+        swapped = pairs[expected]
+        assert np.array_equal(replicas[swapped], swapped + 1) and np.array_equal(replicas[swapped + 1], swapped)
+
+
+@pytest.mark.parametrize('energies', [(-4., 2.), (3., -1.), (0., 0.)])
+def test_exchange_satisfies_detailed_balance(energies):
+    # Two replicas with fixed energies and two betas: the chain of swaps alone must visit the two assignments with
+    # the ratio of their Boltzmann weights, exp(-beta_0 E_b - beta_1 E_a) / exp(-beta_0 E_a - beta_1 E_b).
+    betas = np.array([0.2, 0.5])
+    energies = np.array(energies)
+    generator = np.random.default_rng(2)
+    replicas = np.arange(2)
+    steps = 40000
+    swapped = 0
+    for _ in range(steps):
+        exchange(betas, energies, replicas, 0, generator)
+        swapped += replicas[0] == 1
+    ratio = np.exp((betas[1] - betas[0]) * (energies[1] - energies[0]))
+    assert swapped / steps == pytest.approx(ratio / (1. + ratio), abs=0.01)
+
+
+def test_respace_keeps_the_ends():
+    betas = np.array([0.2, 0.3, 0.35, 0.6])
+    new_betas = respace(betas, np.array([0.9, 0.8, 0.1]))
+    assert new_betas[0] == betas[0] and new_betas[-1] == pytest.approx(betas[-1])
+    assert np.all(np.diff(new_betas) > 0.)
+    assert np.diff(new_betas)[2] < np.diff(betas)[2]  # The pair with the lowest acceptance gets closer.
+
+
+@pytest.mark.parametrize('update, vectorized', [('checkerboard', True), ('metropolis', False)])
+def test_tempered_lattices_match_enumeration(script, update, vectorized):
+    # <|m|> of every slot on a 4 x 4 lattice against exact sums, within 4 binning errors.
+    module = script('Project2/Project2.2.py')
+    betas = np.array([0.2, 0.3, 0.44, 0.6])
+    if vectorized:
+        states = -np.ones((len(betas), 4, 4), dtype=np.int8)
+    else:
+        states = [module.down_lattice(4, update) for _ in betas]
+    outcome = parallel_tempering(module.updates[update], module.lattice_energy, module.magnetisation_per_spin, states,
+                                 betas, 4096, equilibration=100, vectorized=vectorized, seed=5)
+    measured = outcome['observable']
+    exact = np.array([enumerated_observables(module, 4, beta)[0] for beta in betas])
+    assert np.all(np.abs(measured.stats.mean - exact) < 4. * measured.binning.error)
+    assert np.all(outcome['acceptance'] > 0.)
@@ -0,0 +1,51 @@
+import itertools
+import numpy as np
+import pytest
+
+
+def enumerated(spins, thermal_energy, h):
+    # Observables per spin of a ring of 'spins' spins by summing over all its configurations.
+    states = np.array(list(itertools.product([-1, 1], repeat=spins)))
+    magnetisation = np.sum(states, axis=1)
+    energy = -np.sum(states * np.roll(states, -1, axis=1), axis=1) - h * magnetisation
+    weights = np.exp(-(energy - np.min(energy)) / thermal_energy)
+    partition = np.sum(weights)
+    weights /= partition
+
+    def mean(values):
+        return np.sum(weights * values)
+    return {
+        'free_energy': (np.min(energy) - thermal_energy * np.log(partition)) / spins,
+        'energy': mean(energy) / spins,
+        'specific_heat': (mean(energy ** 2) - mean(energy) ** 2) / (thermal_energy ** 2 * spins),
+        'magnetisation': mean(magnetisation) / spins,
+        'susceptibility': (mean(magnetisation ** 2) - mean(magnetisation) ** 2) / (thermal_energy * spins),
+        'correlation': np.array([mean(states[:, 0] * states[:, r]) for r in range(spins // 2 + 1)]),
+    }
+
+
+@pytest.mark.parametrize('spins', [2, 3, 10])
+def test_exact_observables_match_enumeration(script, spins):
+    module = script('Project2/transfer_matrix.py')
+    thermal_energies = np.array([0.3, 1., 2.5, 10.])
+    h_values = np.array([0., 0.1, -1.])
+    grid_kt, grid_h = np.meshgrid(thermal_energies, h_values)
+    exact = module.exact_observables(spins, grid_kt, grid_h)
+    for index in np.ndindex(np.shape(grid_kt)):
+        expected = enumerated(spins, grid_kt[index], grid_h[index])
+        for name in ('free_energy', 'energy', 'specific_heat', 'magnetisation', 'susceptibility'):
+            assert exact[name][index] == pytest.approx(expected[name], rel=1e-9, abs=1e-12), name
+
+
+def test_spin_correlation_matches_enumeration(script):
+    module = script('Project2/transfer_matrix.py')
+    for thermal_energy, h in [(0.5, 0.), (1., 0.1), (3., -0.5)]:
+        expected = enumerated(10, thermal_energy, h)['correlation']
+        assert np.allclose(module.spin_correlation(10, thermal_energy, h), expected, rtol=1e-9, atol=1e-12)
+
+
+def test_long_ring_reaches_the_thermodynamic_limit(script):
+    # Without field the energy per spin of an infinite chain is -tanh(J / kT); no overflow at low temperatures.
+    thermal_energies = np.array([0.05, 0.5, 1., 5.])
+    exact = script('Project2/transfer_matrix.py').exact_observables(10 ** 5, thermal_energies)
+    assert np.allclose(exact['energy'], -np.tanh(1. / thermal_energies), rtol=1e-9)
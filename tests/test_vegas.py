@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+
+
+def test_product_of_powers(script):
+    # The integral of x_1^4 ... x_4^4 over [0, 1]^4 is 5^-4.
+    vegas = script('Project1/vegas.py').vegas
+    integral, error, _ = vegas(lambda x: np.prod(x ** 4, axis=1), np.zeros(4), np.ones(4), 20000,
+                               generator=np.random.default_rng(0))
+    assert abs(integral - 5. ** -4) < 4. * error
+
+
+def test_needs_iterations_after_warmup(script):
+    vegas = script('Project1/vegas.py').vegas
+    with pytest.raises(ValueError):
+        vegas(lambda x: x[:, 0], [0.], [1.], 100, iterations=2, warmup=2)